@@ -14,7 +14,10 @@ Features:
 - One-time switch from multi to specific language
 """
 
+import asyncio
 import logging
+import sys
+
 from dotenv import load_dotenv
 
 from livekit import agents, rtc
@@ -28,29 +31,21 @@ from livekit.agents import (
     function_tool,
     inference,
 )
+# Plugins stay at module scope: they register themselves on import, which
+# livekit requires on the main thread, and `download-files` only fetches
+# model files for plugins that were imported before the CLI starts.
 from livekit.plugins import noise_cancellation, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+from languages import SUPPORTED_LANGUAGES, LangInfo
+
 load_dotenv(".env.local")
 
 logger = logging.getLogger("lang-switch-agent")
 logger.setLevel(logging.INFO)
 
-# Supported languages for Deepgram Nova-3
-# Key: language code, Value: (display name, deepgram code, cartesia code)
-SUPPORTED_LANGUAGES = {
-    "en": ("English", "en", "en"),
-    "es": ("Spanish", "es", "es"),
-    "fr": ("French", "fr", "fr"),
-    "de": ("German", "de", "de"),
-    "pt": ("Portuguese", "pt-BR", "pt"),
-    "nl": ("Dutch", "nl", "nl"),
-    "sv": ("Swedish", "sv", "sv"),
-    "da": ("Danish", "da", "da"),
-    "ru": ("Russian", "ru", "ru"),
-    "it": ("Italian", "it", "it"),
-    "pl": ("Polish", "pl", "pl"),
-}
+# Listed in the tool's error reply when the LLM picks an unsupported code
+_SUPPORTED_KEYS_STR = ", ".join(SUPPORTED_LANGUAGES)
 
 
 class LanguageSwitchAgent(Agent):
@@ -95,6 +90,20 @@ If the user speaks a language not in this list, stick with 'multi' mode.""",
                         "Speak in a neutral way that works for any language."
         )
     
+    def _apply_language(self, lang: LangInfo) -> None:
+        """Switch STT and TTS to the given language in one step.
+        
+        Both update_options calls are synchronous and only queue the new
+        settings on the open streams, so issuing them back to back (with no
+        await in between) applies them in the same event loop iteration.
+        """
+        stt, tts = self.session.stt, self.session.tts
+        
+        if stt is not None:
+            stt.update_options(language=lang.deepgram)
+        if tts is not None:
+            tts.update_options(language=lang.cartesia)
+    
     @function_tool()
     async def set_detected_language(
         self,
@@ -118,28 +127,22 @@ If the user speaks a language not in this list, stick with 'multi' mode.""",
         
         # Validate language code
         if language_code not in SUPPORTED_LANGUAGES:
-            available = ", ".join(SUPPORTED_LANGUAGES.keys())
-            return f"Unsupported language code '{language_code}'. Supported: {available}"
-        
-        lang_name, deepgram_code, cartesia_code = SUPPORTED_LANGUAGES[language_code]
+            return f"Unsupported language code '{language_code}'. Supported: {_SUPPORTED_KEYS_STR}"
         
-        logger.info(f"Switching language from 'multi' to '{language_code}' ({lang_name})")
+        lang = SUPPORTED_LANGUAGES[language_code]
         
-        # Update STT to specific language
-        if self.session.stt is not None:
-            self.session.stt.update_options(language=deepgram_code)
-            logger.info(f"STT updated to language: {deepgram_code}")
+        self._apply_language(lang)
         
-        # Update TTS to specific language
-        if self.session.tts is not None:
-            self.session.tts.update_options(language=cartesia_code)
-            logger.info(f"TTS updated to language: {cartesia_code}")
+        logger.info(
+            f"Language switched from 'multi' to '{language_code}' ({lang.name})",
+            extra={"from": "multi", "to": language_code, "stt": lang.deepgram, "tts": lang.cartesia},
+        )
         
         # Lock the language - no more switches
         self._language_locked = True
         self._current_language = language_code
         
-        return f"Language successfully set to {lang_name} ({language_code}). STT switched from 'multi' to '{deepgram_code}' for better accuracy. Continue the conversation in {lang_name}."
+        return f"Language successfully set to {lang.name} ({language_code}). STT switched from 'multi' to '{lang.deepgram}' for better accuracy. Continue the conversation in {lang.name}."
 
 
 # Create the agent server
@@ -207,4 +210,9 @@ async def entrypoint(ctx: JobContext) -> None:
 
 
 if __name__ == "__main__":
+    if sys.platform != "win32":
+        import uvloop
+        
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     agents.cli.run_app(server)
@@ -4,22 +4,29 @@ Language Switch Agent with Background Observer Pattern
 This agent uses a background observer to detect the user's language automatically.
 The main agent focuses on its task (collecting feedback) while the observer:
 1. Monitors conversation transcripts
-2. After 2+ user turns, runs an LLM to detect language with high confidence (99%+)
-3. Waits for the right moment to switch STT (when user turn ends)
+2. Once there are 3+ user turns, classifies them in-process with fastText
+   (lid.176.ftz), falling back to an LLM when the classifier is ambiguous
+3. Waits for the right moment to switch STT (when the user is not speaking)
 4. Only switches STT (not TTS) for better transcription accuracy
 
 Key differences from the function tool approach:
 - No language detection instructions in main agent's prompt
 - Background task runs independently and doesn't interrupt conversation
-- LLM-based language detection with confidence scoring
+- Classifier-first language detection, LLM only as a fallback
 - Seamless switching at conversation boundaries
 """
 
 import asyncio
+import difflib
 import logging
+import os
+import re
+import sys
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Any, Optional
 
+import orjson
 from dotenv import load_dotenv
 
 from livekit import agents, rtc
@@ -33,40 +40,196 @@ from livekit.agents import (
     function_tool,
     inference,
     UserInputTranscribedEvent,
+    UserStateChangedEvent,
 )
 from livekit.agents.llm import ChatContext
+# Plugins stay at module scope: they register themselves on import, which
+# livekit requires on the main thread, and `download-files` only fetches
+# model files for plugins that were imported before the CLI starts.
 from livekit.plugins import noise_cancellation, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
+from languages import SUPPORTED_LANGUAGES
+
 load_dotenv(".env.local")
 
 logger = logging.getLogger("lang-switch-observer")
 logger.setLevel(logging.INFO)
 
+# fastText language-ID model (lid.176.ftz) used for in-process detection.
+# Download from https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz
+LID_MODEL_PATH = os.getenv("LID_MODEL_PATH", "lid.176.ftz")
+
+# The STT switch is permanent, so Latin-script detection waits for this many
+# distinct user turns; one- or two-word openers ("Hola") are too easy to misread
+MIN_DETECTION_TURNS = 3
+
+# Below this classifier probability we fall back to the LLM
+LID_CONFIDENCE_THRESHOLD = 0.95
+# Lower bar when the classifier agrees with the language the diacritics suggest
+LID_HINT_CONFIDENCE_THRESHOLD = 0.85
+
+# Minimum LLM confidence to switch
+LLM_CONFIDENCE_THRESHOLD = 0.95
+
+
+# Language detection prompt, built once at import time. The static rules go
+# in the system message so every detection call shares an identical prompt
+# prefix (eligible for provider-side prompt caching); only the user message
+# with the transcripts varies.
+_LANG_LIST_STR = ", ".join(f"{code} ({lang.name})" for code, lang in SUPPORTED_LANGUAGES.items())
+
+_DETECTION_SYSTEM_PROMPT = f"""Analyze the user messages you are given and determine what language they are speaking.
+
+Supported languages: {_LANG_LIST_STR}
+
+CRITICAL RULES:
+- Only return a language if the user is speaking COHERENTLY in ONE language
+- If the user is mixing multiple languages, return null with 0.0 confidence
+- If messages are too short, fragmented, or unclear, return null
+- If transcription quality seems poor (gibberish, wrong words), return null
+- Only return high confidence (0.95+) when ALL messages are clearly in the same language
+- Consider the semantic coherence - are they saying something meaningful in that language?
+
+Return null if:
+- User mixes languages (e.g., Russian words + Portuguese words)
+- Messages don't form coherent sentences
+- Transcription looks like errors or noise
+- You're not absolutely certain about the language
+"""
 
-# Supported languages for Deepgram Nova-3
-SUPPORTED_LANGUAGES = {
-    "en": ("English", "en"),
-    "es": ("Spanish", "es"),
-    "fr": ("French", "fr"),
-    "de": ("German", "de"),
-    "pt": ("Portuguese", "pt-BR"),
-    "nl": ("Dutch", "nl"),
-    "sv": ("Swedish", "sv"),
-    "da": ("Danish", "da"),
-    "ru": ("Russian", "ru"),
-    "it": ("Italian", "it"),
-    "pl": ("Polish", "pl"),
+# Structured output for the detection LLM: only a language code and a
+# confidence can be emitted, which keeps decoding to a handful of tokens.
+_DETECTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "language_detection",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "language_code": {
+                    "type": ["string", "null"],
+                    "enum": [*SUPPORTED_LANGUAGES, None],
+                },
+                "confidence": {"type": "number"},
+            },
+            "required": ["language_code", "confidence"],
+            "additionalProperties": False,
+        },
+    },
 }
+_DETECTION_MAX_TOKENS = 20
+
+# Only the most recent user turns are kept for detection
+MAX_DETECTION_TURNS = 8
+
+# Switch without any detection call once Deepgram reports the same
+# language for this many consecutive user turns
+STT_LANGUAGE_AGREEMENT_TURNS = 3
+
+# Quiet period after the last user turn before running detection (seconds)
+DETECTION_DEBOUNCE_DELAY = 0.5
+
+# Transcripts at least this similar to the previous turn are treated as duplicates
+_DUPLICATE_TURN_RATIO = 0.9
+
+# Matches the flat JSON object in the detection LLM's reply
+_JSON_RE = re.compile(r"\{[^{}]*\}")
+
+# Letters that, among SUPPORTED_LANGUAGES, occur in only one language
+_SCRIPT_MARKERS = {
+    "pl": frozenset("ąęłńśźżćĄĘŁŃŚŹŻĆ"),
+    "da": frozenset("æøÆØ"),
+    "de": frozenset("ßüÜ"),
+    "es": frozenset("ñ¿¡Ñ"),
+    "pt": frozenset("ãõÃÕ"),
+}
+# å is shared by Swedish and Danish, ä/ö by Swedish and German
+_SV_MARKERS = frozenset("åÅ")
+_DE_SV_MARKERS = frozenset("äöÄÖ")
+
+# Minimum share of Cyrillic letters for a one-shot Russian match
+_CYRILLIC_THRESHOLD = 0.7
+
+
+def _turn_marker_language(text: str) -> Optional[str]:
+    """
+    Find the single language whose marker letters appear in one turn.
+    
+    Returns None when there are no markers or they point at several languages.
+    """
+    hits = dict.fromkeys(_SCRIPT_MARKERS, 0)
+    sv_hits = 0
+    de_sv_hits = 0
+    
+    for ch in text:
+        if ch.isascii():
+            continue
+        if ch in _SV_MARKERS:
+            sv_hits += 1
+        elif ch in _DE_SV_MARKERS:
+            de_sv_hits += 1
+        else:
+            for code, markers in _SCRIPT_MARKERS.items():
+                if ch in markers:
+                    hits[code] += 1
+                    break
+    
+    if sv_hits and hits["da"]:
+        hits["da"] += sv_hits
+    elif sv_hits and not hits["da"] and not hits["de"]:
+        hits["sv"] = sv_hits + de_sv_hits
+    elif de_sv_hits and not sv_hits and not hits["da"]:
+        hits["de"] += de_sv_hits
+    
+    candidates = [code for code, count in hits.items() if count]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _quick_script_detect(transcripts: list[str]) -> Optional[str]:
+    """
+    Detect a language from its script alone, without a classifier or LLM.
+    
+    Only a mostly-Cyrillic text is unambiguous enough to settle it in one turn.
+    """
+    alpha = 0
+    cyrillic = 0
+    for ch in " ".join(transcripts):
+        if ch.isalpha():
+            alpha += 1
+            if "\u0400" <= ch <= "\u04ff":
+                cyrillic += 1
+    
+    if alpha and cyrillic / alpha > _CYRILLIC_THRESHOLD:
+        return "ru"
+    return None
+
+
+def _diacritic_hint(transcripts: list[str]) -> Optional[str]:
+    """
+    Suggest a language from Latin-script diacritics.
+    
+    Names and places carry them too ("São Paulo", "Łódź", "Müller"), so this is
+    only a hint for the classifier to confirm, never a decision on its own.
+    Returns None unless every turn with markers points at the same language.
+    """
+    languages = {lang for lang in map(_turn_marker_language, transcripts) if lang}
+    return languages.pop() if len(languages) == 1 else None
 
 
 @dataclass
 class LanguageObserverData:
     """State for the language observer."""
-    user_turns: list[str] = field(default_factory=list)
+    user_turns: deque[str] = field(default_factory=lambda: deque(maxlen=MAX_DETECTION_TURNS))
+    turn_count: int = 0
+    stt_languages: deque[str] = field(
+        default_factory=lambda: deque(maxlen=STT_LANGUAGE_AGREEMENT_TURNS)
+    )
     language_detected: bool = False
     detected_language: Optional[str] = None
     pending_switch: bool = False
+    debounce_handle: Optional[asyncio.TimerHandle] = None
 
 
 class FeedbackCollectorAgent(Agent):
@@ -117,24 +280,82 @@ Just have a natural conversation and collect feedback.""",
         )
 
 
+def load_language_classifier(path: str = LID_MODEL_PATH) -> Optional[Any]:
+    """
+    Load the fastText language identification model.
+    
+    Returns None if fasttext is not installed or the model file is missing,
+    in which case the observer relies on LLM detection only.
+    """
+    try:
+        import fasttext
+    except ImportError:
+        logger.warning("fasttext not installed - using LLM-only language detection")
+        return None
+    
+    if not os.path.exists(path):
+        logger.warning(f"Language ID model not found at {path} - using LLM-only language detection")
+        return None
+    
+    return fasttext.load_model(path)
+
+
 async def start_language_observer(
     session: AgentSession,
     observer_llm: inference.LLM,
+    lid_model: Optional[Any] = None,
 ) -> None:
     """
     Start the background language observer.
     
     This observer monitors the conversation and detects the user's language
-    using a separate LLM call. When confident about the language (99%+),
-    it switches the STT model at the right moment.
+    with an in-process fastText classifier, falling back to a separate LLM
+    call when the classifier is unavailable or ambiguous. When confident
+    about the language, it switches the STT model at the right moment.
     """
     
     # State for the observer
     state = LanguageObserverData()
     
-    # Lock for thread-safe state updates
+    # All state writes happen on the event loop thread, so only the STT
+    # switch itself (which mutates the session) needs a lock
     state_lock = asyncio.Lock()
     
+    # Serializes detection runs so only one LLM call is in flight
+    detection_lock = asyncio.Lock()
+    
+    def detect_language_with_classifier(transcripts: list[str]) -> tuple[Optional[str], float]:
+        """
+        Detect language in-process with the fastText classifier.
+        
+        Returns:
+            Tuple of (language_code, confidence) or (None, 0.0) if unavailable
+        """
+        if lid_model is None or not transcripts:
+            return None, 0.0
+        
+        # Call the native predictor directly: the Python wrapper in fasttext-wheel
+        # 0.9.2 wraps the result with np.array(copy=False), which numpy 2 rejects.
+        # It expects a single newline-terminated line.
+        text = " ".join(" ".join(transcripts).splitlines()) + "\n"
+        try:
+            predictions = lid_model.f.predict(text, 1, 0.0, "strict")
+        except Exception as e:
+            logger.warning(f"Classifier detection failed: {e}")
+            return None, 0.0
+        if not predictions:
+            return None, 0.0
+        
+        probability, label = predictions[0]
+        lang_code = label.removeprefix("__label__")
+        confidence = float(probability)
+        
+        if lang_code not in SUPPORTED_LANGUAGES:
+            return None, 0.0
+        
+        logger.debug(f"Classifier detection: {lang_code} with {confidence:.0%} confidence")
+        return lang_code, confidence
+    
     async def detect_language_with_llm(transcripts: list[str]) -> tuple[Optional[str], float]:
         """
         Use LLM to detect language from transcripts with confidence score.
@@ -148,67 +369,42 @@ async def start_language_observer(
         # Combine transcripts for analysis
         combined_text = "\n".join(f"- {t}" for t in transcripts)
         
-        # Create a chat context for language detection
-        detection_prompt = f"""Analyze these user messages and determine what language they are speaking.
-
-User messages:
-{combined_text}
-
-Supported languages: {', '.join(f'{code} ({name})' for code, (name, _) in SUPPORTED_LANGUAGES.items())}
-
-Respond in JSON format ONLY:
-{{"language_code": "xx", "confidence": 0.99, "language_name": "Language Name"}}
-
-CRITICAL RULES:
-- confidence must be between 0.0 and 1.0
-- Only return a language if the user is speaking COHERENTLY in ONE language
-- If the user is mixing multiple languages, return null with 0.0 confidence
-- If messages are too short, fragmented, or unclear, return null
-- If transcription quality seems poor (gibberish, wrong words), return null
-- Only return high confidence (0.95+) when ALL messages are clearly in the same language
-- Consider the semantic coherence - are they saying something meaningful in that language?
-
-Return null if:
-- User mixes languages (e.g., Russian words + Portuguese words)
-- Messages don't form coherent sentences
-- Transcription looks like errors or noise
-- You're not absolutely certain about the language
-
-{{"language_code": null, "confidence": 0.0, "language_name": null}}
-"""
-        
         try:
-            import json
-            
-            # Create a simple chat context for detection
+            # Static rules first so the prompt prefix is identical across calls
             chat_ctx = ChatContext()
-            chat_ctx.add_message(role="user", content=detection_prompt)
+            chat_ctx.add_message(role="system", content=_DETECTION_SYSTEM_PROMPT)
+            chat_ctx.add_message(role="user", content="User messages:\n" + combined_text)
             
             # Run LLM for detection and collect full response
-            response_text = ""
-            async with observer_llm.chat(chat_ctx=chat_ctx) as stream:
+            response_parts: list[str] = []
+            async with observer_llm.chat(
+                chat_ctx=chat_ctx,
+                extra_kwargs={
+                    "response_format": _DETECTION_RESPONSE_FORMAT,
+                    "max_completion_tokens": _DETECTION_MAX_TOKENS,
+                },
+            ) as stream:
                 async for chunk in stream:
                     # ChatChunk has delta.content
                     if chunk.delta and chunk.delta.content:
-                        response_text += chunk.delta.content
+                        response_parts.append(chunk.delta.content)
+            response_text = "".join(response_parts)
             
             logger.debug(f"LLM detection response: {response_text[:200]}")
             
             # Parse JSON response
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = response_text[start_idx:end_idx]
-                result = json.loads(json_str)
+            match = _JSON_RE.search(response_text)
+            if match:
+                result = orjson.loads(match.group(0))
                 
                 lang_code = result.get("language_code")
                 confidence = float(result.get("confidence", 0.0))
-                lang_name = result.get("language_name", "Unknown")
-                
                 if lang_code and lang_code in SUPPORTED_LANGUAGES:
-                    logger.info(f"🎯 Language detection: {lang_name} ({lang_code}) with {confidence:.0%} confidence")
+                    logger.info(f"🎯 Language detection: {SUPPORTED_LANGUAGES[lang_code].name} ({lang_code}) with {confidence:.0%} confidence")
                     return lang_code, confidence
                     
+        except orjson.JSONDecodeError as e:
+            logger.warning(f"Language detection returned invalid JSON: {e}")
         except Exception as e:
             logger.error(f"Language detection failed: {e}")
         
@@ -220,14 +416,15 @@ Return null if:
             if state.language_detected:
                 return  # Already switched
             
-            lang_name, deepgram_code = SUPPORTED_LANGUAGES[language_code]
-            
-            logger.info(f"🔄 Switching STT from 'multi' to '{deepgram_code}' ({lang_name})")
+            lang = SUPPORTED_LANGUAGES[language_code]
             
             # Update STT only (not TTS)
             if session.stt is not None:
-                session.stt.update_options(language=deepgram_code)
-                logger.info(f"✅ STT successfully switched to: {deepgram_code}")
+                session.stt.update_options(language=lang.deepgram)
+                logger.info(
+                    f"✅ STT switched from 'multi' to '{lang.deepgram}' ({lang.name})",
+                    extra={"from": "multi", "to": language_code, "stt": lang.deepgram},
+                )
             
             state.language_detected = True
             state.detected_language = language_code
@@ -235,23 +432,115 @@ Return null if:
     
     async def evaluate_and_switch() -> None:
         """Evaluate collected transcripts and switch language if confident enough."""
-        async with state_lock:
-            if state.language_detected or len(state.user_turns) < 3:
-                return  # Already detected or not enough data
-            
-            transcripts = state.user_turns.copy()
+        async with detection_lock:
+            try:
+                await _evaluate_and_switch()
+            except Exception:
+                # Runs from a timer callback, so nothing else would see the error
+                logger.exception("Language evaluation failed")
+    
+    async def _evaluate_and_switch() -> None:
+        if state.language_detected or state.pending_switch:
+            return  # Already detected, or a switch is waiting for silence
         
-        # Run language detection
-        lang_code, confidence = await detect_language_with_llm(transcripts)
+        # Drop exact repeats so they don't inflate the turn count
+        transcripts = list(dict.fromkeys(state.user_turns))
         
-        if lang_code and confidence >= 0.95:
-            async with state_lock:
-                state.pending_switch = True
+        # Cheapest check first: a non-Latin script settles it
+        lang_code = _quick_script_detect(transcripts)
+        if lang_code:
+            logger.info(f"🎯 Language detection (script): {lang_code}")
+        elif len(transcripts) < MIN_DETECTION_TURNS:
+            return  # Not enough data to switch for good yet
+        else:
+            # Then the in-process classifier - no network round-trip. Diacritics
+            # can't decide alone, but the classifier agreeing with them can.
+            lang_code, confidence = detect_language_with_classifier(transcripts)
+            if lang_code and lang_code == _diacritic_hint(transcripts):
+                threshold = LID_HINT_CONFIDENCE_THRESHOLD
+            else:
+                threshold = LID_CONFIDENCE_THRESHOLD
             
-            # Wait for a good moment to switch (brief pause)
-            await asyncio.sleep(0.1)
-            
-            await switch_stt_language(lang_code)
+            if lang_code and confidence >= threshold:
+                logger.info(f"🎯 Language detection (classifier): {lang_code} with {confidence:.0%} confidence")
+            else:
+                # Classifier ambiguous or unavailable - ask the LLM
+                lang_code, confidence = await detect_language_with_llm(transcripts)
+                if confidence < LLM_CONFIDENCE_THRESHOLD:
+                    lang_code = None
+        
+        if lang_code:
+            await switch_when_silent(lang_code)
+    
+    async def switch_when_silent(language_code: str) -> None:
+        """Switch STT between utterances, never mid-speech."""
+        # Stops further detection and a second switch while this one waits
+        state.pending_switch = True
+        await wait_for_user_silence()
+        await switch_stt_language(language_code)
+    
+    def check_stt_language(language: Optional[str]) -> bool:
+        """
+        Track the language Deepgram reports for each turn.
+        
+        Returns True (and starts the switch) once the last
+        STT_LANGUAGE_AGREEMENT_TURNS turns all agree on a supported language.
+        """
+        if state.pending_switch:
+            return True  # A switch is already on its way
+        if not language:
+            state.stt_languages.clear()
+            return False
+        
+        # Deepgram may report regional variants, e.g. "pt-BR" or "en-US"
+        state.stt_languages.append(language.split("-", 1)[0].lower())
+        
+        if len(state.stt_languages) < STT_LANGUAGE_AGREEMENT_TURNS:
+            return False
+        
+        lang_code = state.stt_languages[0]
+        if lang_code not in SUPPORTED_LANGUAGES or state.stt_languages.count(lang_code) != len(state.stt_languages):
+            return False
+        
+        logger.info(f"🎯 Language detection (STT): {lang_code} reported for {STT_LANGUAGE_AGREEMENT_TURNS} turns")
+        
+        # Nothing left to detect - drop any pending debounced detection
+        if state.debounce_handle is not None:
+            state.debounce_handle.cancel()
+        # Set before the task runs so the next turn can't start another switch
+        state.pending_switch = True
+        asyncio.create_task(switch_when_silent(lang_code))
+        return True
+    
+    async def wait_for_user_silence() -> None:
+        """Return as soon as the user is not speaking."""
+        if session.user_state != "speaking":
+            return
+        
+        silent = asyncio.Event()
+        
+        def on_user_state_changed(event: UserStateChangedEvent) -> None:
+            if event.new_state != "speaking":
+                silent.set()
+        
+        session.on("user_state_changed", on_user_state_changed)
+        try:
+            await silent.wait()
+        finally:
+            session.off("user_state_changed", on_user_state_changed)
+    
+    def schedule_evaluation() -> None:
+        """(Re)start the debounce timer so detection runs once the user goes quiet."""
+        if state.debounce_handle is not None:
+            state.debounce_handle.cancel()
+        if state.pending_switch:
+            return
+        
+        loop = asyncio.get_running_loop()
+        state.debounce_handle = loop.call_later(
+            DETECTION_DEBOUNCE_DELAY,
+            lambda: asyncio.create_task(evaluate_and_switch()),
+        )
     
     # Event handler for user transcriptions
     @session.on("user_input_transcribed")
@@ -265,23 +554,35 @@ Return null if:
         if not transcript:
             return
         
-        # Check if we already detected language
-        if state.language_detected:
+        # Check if we already detected language, or are about to switch
+        if state.language_detected or state.pending_switch:
             return
         
-        # Add to user turns
-        async def add_turn() -> None:
-            async with state_lock:
-                state.user_turns.append(transcript)
-                turn_count = len(state.user_turns)
-            
-            logger.info(f"📝 Observer: User turn #{turn_count}: {transcript[:50]}...")
-            
-            # After 3+ turns, try to detect language (need enough context for coherent speech detection)
-            if turn_count >= 3:
-                asyncio.create_task(evaluate_and_switch())
+        # Skip near-duplicate finals of the same utterance
+        if state.user_turns:
+            matcher = difflib.SequenceMatcher(
+                None, state.user_turns[-1].lower(), transcript.lower()
+            )
+            if (
+                matcher.quick_ratio() > _DUPLICATE_TURN_RATIO
+                and matcher.ratio() > _DUPLICATE_TURN_RATIO
+            ):
+                return
+        
+        # Handlers run on the event loop, so append inline - no task or lock
+        state.user_turns.append(transcript)
+        state.turn_count += 1
         
-        asyncio.create_task(add_turn())
+        logger.info(f"📝 Observer: User turn #{state.turn_count}: {transcript[:50]}...")
+        
+        # Fast path: Deepgram already tags each result with its language
+        if check_stt_language(event.language):
+            return
+        
+        # The script check runs on every turn; the classifier and LLM wait
+        # for MIN_DETECTION_TURNS turns of speech.
+        # Debounced so a burst of turns triggers a single detection.
+        schedule_evaluation()
     
     logger.info("🔍 Language observer started - monitoring conversation for language detection")
 
@@ -291,8 +592,12 @@ server = AgentServer()
 
 
 def prewarm(proc: JobProcess) -> None:
-    """Prewarm function to load VAD model once per process."""
+    """Prewarm function to load VAD and language ID models once per process."""
+    # Silero VAD ships as a small ONNX model run by onnxruntime, so there is
+    # no torch state_dict to place in shared memory; loading it per process
+    # costs a few MB at most and keeps workers fully isolated.
     proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["lid"] = load_language_classifier()
 
 
 server.setup_fnc = prewarm
@@ -304,6 +609,10 @@ async def entrypoint(ctx: JobContext) -> None:
     
     ctx.log_context_fields = {"room": ctx.room.name}
     
+    # One LLM instance serves both the conversation and the observer.
+    # chat() is stateless per call and requests share the job's HTTP session.
+    llm = inference.LLM(model="openai/gpt-4.1-mini")
+    
     # Create session with STT in multilingual mode
     session = AgentSession(
         # STT: Start in multilingual mode
@@ -312,9 +621,7 @@ async def entrypoint(ctx: JobContext) -> None:
             language="multi",  # Will be switched by observer
         ),
         # LLM for main conversation
-        llm=inference.LLM(
-            model="openai/gpt-4.1-mini",
-        ),
+        llm=llm,
         # TTS - stays the same, no language switching
         tts=inference.TTS(
             model="cartesia/sonic-3",
@@ -326,12 +633,9 @@ async def entrypoint(ctx: JobContext) -> None:
         turn_detection=MultilingualModel(),
     )
     
-    # Create a separate LLM instance for the observer
-    # This can be a different (possibly slower but smarter) model
-    observer_llm = inference.LLM(model="openai/gpt-4.1-mini")
-    
     # Start the background language observer
-    await start_language_observer(session, observer_llm)
+    # Pass a separate inference.LLM here to use a different detection model
+    await start_language_observer(session, llm, ctx.proc.userdata.get("lid"))
     
     # Start the session with our feedback collector agent
     await session.start(
@@ -353,4 +657,9 @@ async def entrypoint(ctx: JobContext) -> None:
 
 
 if __name__ == "__main__":
+    if sys.platform != "win32":
+        import uvloop
+        
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     agents.cli.run_app(server)
@@ -0,0 +1,33 @@
+"""
+Supported languages shared by both agent patterns.
+
+Each entry maps an ISO 639-1 code to the display name and the language
+codes expected by Deepgram Nova-3 (STT) and Cartesia Sonic-3 (TTS).
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from types import MappingProxyType
+
+
+@dataclass(slots=True, frozen=True)
+class LangInfo:
+    """Display name and provider-specific codes for one language."""
+    name: str
+    deepgram: str
+    cartesia: str
+
+
+SUPPORTED_LANGUAGES: Mapping[str, LangInfo] = MappingProxyType({
+    "en": LangInfo("English", "en", "en"),
+    "es": LangInfo("Spanish", "es", "es"),
+    "fr": LangInfo("French", "fr", "fr"),
+    "de": LangInfo("German", "de", "de"),
+    "pt": LangInfo("Portuguese", "pt-BR", "pt"),
+    "nl": LangInfo("Dutch", "nl", "nl"),
+    "sv": LangInfo("Swedish", "sv", "sv"),
+    "da": LangInfo("Danish", "da", "da"),
+    "ru": LangInfo("Russian", "ru", "ru"),
+    "it": LangInfo("Italian", "it", "it"),
+    "pl": LangInfo("Polish", "pl", "pl"),
+})
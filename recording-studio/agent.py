@@ -13,14 +13,17 @@ demonstrates:
   - Managing recordings directory with metadata
 ---
 """
+import asyncio
+import bisect
+import functools
 import logging
 import wave
 import json
 from pathlib import Path
-from typing import AsyncIterable, Optional
+from typing import AsyncIterable, AsyncIterator, Optional
 from datetime import datetime
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli, ModelSettings, inference
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, ModelSettings, inference
 from livekit.agents.llm import function_tool
 from livekit.agents.voice import Agent, AgentSession, RunContext
 from livekit.plugins import silero
@@ -65,6 +68,73 @@ AVAILABLE_VOICES = [
     },
     # Add more if needed
 ]
+_VOICE_BY_NAME = {v['name'].lower(): v for v in AVAILABLE_VOICES}
+
+# Playback is streamed in chunks of this many milliseconds
+PLAYBACK_CHUNK_MS = 20
+# ...read from disk this many chunks (0.5s) at a time
+PLAYBACK_READ_CHUNKS = 25
+
+# Recorded audio is buffered and written to disk once this many bytes pile up
+# (~1.5s of 24kHz mono), instead of one thread hop per 10-20ms frame
+RECORD_FLUSH_BYTES = 64 * 1024
+
+
+async def stream_wav(path: Path) -> AsyncIterator[rtc.AudioFrame]:
+    """Yield a WAV file as short audio frames, reading large blocks off the event loop."""
+    with wave.open(str(path), 'rb') as wav_file:
+        num_channels = wav_file.getnchannels()
+        sample_rate = wav_file.getframerate()
+        bytes_per_frame = wav_file.getsampwidth() * num_channels
+        chunk_frames = sample_rate * PLAYBACK_CHUNK_MS // 1000
+        chunk_bytes = chunk_frames * bytes_per_frame
+        read_frames = chunk_frames * PLAYBACK_READ_CHUNKS
+        
+        while True:
+            # One thread hop per block; slicing it into frames is cheap on the loop
+            block = await asyncio.to_thread(wav_file.readframes, read_frames)
+            if not block:
+                break
+            # AudioFrame copies its input, so zero-copy slices of the block are safe
+            view = memoryview(block)
+            for start in range(0, len(block), chunk_bytes):
+                data = view[start:start + chunk_bytes]
+                yield rtc.AudioFrame(
+                    data=data,
+                    sample_rate=sample_rate,
+                    num_channels=num_channels,
+                    samples_per_channel=len(data) // bytes_per_frame
+                )
+
+
+def _open_wav(path: Path, sample_rate: int, num_channels: int, sample_width: int) -> wave.Wave_write:
+    wav_file = wave.open(str(path), 'wb')
+    wav_file.setnchannels(num_channels)
+    wav_file.setsampwidth(sample_width)
+    wav_file.setframerate(sample_rate)
+    return wav_file
+
+
+def _finish_wav(wav_file: wave.Wave_write, pending: bytes) -> None:
+    if pending:
+        wav_file.writeframesraw(pending)
+    wav_file.close()
+
+
+def _write_meta(path: Path, meta: dict) -> None:
+    with open(path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+@functools.cache
+def load_vad() -> silero.VAD:
+    """Load the VAD model once per process and share it across agent instances."""
+    return silero.VAD.load()
+
+
+def prewarm(proc: JobProcess):
+    load_vad()
+
 
 class RecordingStudioAgent(Agent):
     def __init__(self) -> None:
@@ -84,19 +154,23 @@ class RecordingStudioAgent(Agent):
             stt="assemblyai/universal-streaming",
             llm="openai/gpt-4.1-mini",
             tts="elevenlabs/eleven_turbo_v2_5:Xb7hH8MSUJpSbSDYk0k2",
-            vad=silero.VAD.load()
+            vad=load_vad()
         )
         
         self.is_recording = False
-        self.audio_buffer = []
+        self._wav: Optional[wave.Wave_write] = None
+        self._pending = bytearray()
         self.sample_rate = None
         self.num_channels = None
+        self._sample_count = 0
         self.recordings_dir = Path(__file__).parent / "recordings"
         self.recordings_dir.mkdir(exist_ok=True)
         self.current_voice = AVAILABLE_VOICES[4]
         self.last_recording = None
         self.last_recording_text = None
         self._should_greet = False
+        # (wav filename, metadata) sorted by filename; built on first use
+        self._recordings_index: Optional[list[tuple[str, dict]]] = None
     
     @function_tool
     async def change_voice(self, context: RunContext, voice_name: Optional[str] = None):
@@ -105,7 +179,7 @@ class RecordingStudioAgent(Agent):
             voices_list = [f"{v['name']} - {v['description']}" for v in AVAILABLE_VOICES]
             return f"Available voices:\n" + "\n".join(voices_list) + f"\n\nCurrent voice: {self.current_voice['name']}"
         
-        voice_info = next((v for v in AVAILABLE_VOICES if v['name'].lower() == voice_name.lower()), None)
+        voice_info = _VOICE_BY_NAME.get(voice_name.lower())
         if voice_info is None:
             available = ", ".join([v['name'] for v in AVAILABLE_VOICES])
             return f"Voice '{voice_name}' not found. Available: {available}"
@@ -116,6 +190,7 @@ class RecordingStudioAgent(Agent):
         new_agent.current_voice = voice_info
         new_agent._tts = inference.TTS.from_model_string(voice_info['model'])
         new_agent.recordings_dir = self.recordings_dir
+        new_agent._recordings_index = self._recordings_index
         new_agent.last_recording = self.last_recording
         new_agent.last_recording_text = self.last_recording_text
         new_agent._should_greet = True
@@ -126,35 +201,60 @@ class RecordingStudioAgent(Agent):
     async def list_recordings(self, context: RunContext):
         """List all recordings with their metadata."""
         recordings = []
-        for wav_file in sorted(self.recordings_dir.glob("*.wav")):
-            meta_file = wav_file.with_suffix(".json")
-            if meta_file.exists():
-                with open(meta_file, 'r') as f:
-                    meta = json.load(f)
-                    voice_display = meta.get('voice_name', meta.get('voice', 'unknown'))
-                    recordings.append(f"{wav_file.name}: \"{meta['text']}\" (voice: {voice_display})")
+        for filename, meta in self._get_recordings_index():
+            voice_display = meta.get('voice_name', meta.get('voice', 'unknown'))
+            recordings.append(f"{filename}: \"{meta['text']}\" (voice: {voice_display})")
         
         if not recordings:
             return None, "No recordings found yet."
         
         return None, f"Recordings:\n" + "\n".join(recordings)
     
+    def _get_recordings_index(self) -> list[tuple[str, dict]]:
+        """Return the recordings index, scanning the directory only the first time."""
+        if self._recordings_index is None:
+            self._recordings_index = []
+            for wav_file in sorted(self.recordings_dir.glob("*.wav")):
+                meta_file = wav_file.with_suffix(".json")
+                if meta_file.exists():
+                    with open(meta_file, 'r') as f:
+                        self._recordings_index.append((wav_file.name, json.load(f)))
+        return self._recordings_index
+    
+    def _index_recording(self, filename: str, meta: dict) -> None:
+        index = self._get_recordings_index()
+        # Filenames are timestamped, so sorting by name keeps recordings in order
+        pos = bisect.bisect_left(index, filename, key=lambda entry: entry[0])
+        if pos < len(index) and index[pos][0] == filename:
+            index[pos] = (filename, meta)
+        else:
+            index.insert(pos, (filename, meta))
+    
     @function_tool
     async def record_text(self, context: RunContext, text: str):
         """Record the given text as audio and save it to a file."""
         logger.info(f"Recording text: {text}")
         
-        await self.session.say("Recording now.")
+        # Set up the recording while the preamble plays, so capture can start
+        # the moment it finishes
+        preamble = self.session.say("Recording now.")
         
-        self.is_recording = True
-        self.audio_buffer = []
+        if self._wav is not None:
+            # Left open by an interrupted recording
+            await self._flush_wav()
+            await asyncio.to_thread(self._wav.close)
+            self._wav = None
+        self._pending.clear()
         self.sample_rate = None
         self.num_channels = None
+        self._sample_count = 0
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.last_recording = f"recording_{timestamp}.wav"
         self.last_recording_text = text
         
+        await preamble
+        self.is_recording = True
         await self.session.say(text)
         self.is_recording = False
         
@@ -172,26 +272,12 @@ class RecordingStudioAgent(Agent):
         if not recording_path.exists():
             return None, f"Recording '{filename}' not found. Use list_recordings to see available files."
         
+        # Only the header is read here; the audio itself is streamed below
         with wave.open(str(recording_path), 'rb') as wav_file:
-            num_channels = wav_file.getnchannels()
-            sample_rate = wav_file.getframerate()
-            frames = wav_file.readframes(wav_file.getnframes())
-            num_frames = wav_file.getnframes()
-            
-            duration = num_frames / sample_rate
+            duration = wav_file.getnframes() / wav_file.getframerate()
             logger.info(f"Playing {filename}: {duration:.2f}s")
 
-        audio_frame = rtc.AudioFrame(
-            data=frames,
-            sample_rate=sample_rate,
-            num_channels=num_channels,
-            samples_per_channel=num_frames
-        )
-
-        async def audio_generator():
-            yield audio_frame
-
-        await self.session.say("Here's the recording", audio=audio_generator())
+        await self.session.say("Here's the recording", audio=stream_wav(recording_path))
         return None, f"Played {filename}"
     
     async def tts_node(self, text: AsyncIterable[str], model_settings: ModelSettings):
@@ -199,52 +285,69 @@ class RecordingStudioAgent(Agent):
             audio_stream = Agent.default.tts_node(self, text, model_settings)
             
             async for frame in audio_stream:
-                if self.is_recording:
-                    if self.sample_rate is None:
+                if self.is_recording and self.last_recording is not None:
+                    if self._wav is None:
                         self.sample_rate = frame.sample_rate
                         self.num_channels = frame.num_channels
+                        self._wav = await asyncio.to_thread(
+                            _open_wav, self.recordings_dir / self.last_recording,
+                            self.sample_rate, self.num_channels, 2
+                        )
                         logger.info(f"Recording audio: {self.sample_rate}Hz, {self.num_channels}ch")
                     
-                    self.audio_buffer.append(bytes(frame.data))
+                    # Stream to disk in batches; memory stays flat however long the recording
+                    self._pending += frame.data
+                    self._sample_count += frame.samples_per_channel
+                    if len(self._pending) >= RECORD_FLUSH_BYTES:
+                        await self._flush_wav()
                 
                 yield frame
             
-            if self.is_recording and self.audio_buffer:
+            if self.is_recording and self._wav is not None:
                 await self._save_recording()
         
         return process_and_record_audio()
     
+    async def _flush_wav(self):
+        """Write buffered audio to the open WAV file on a worker thread."""
+        if self._wav is None or not self._pending:
+            return
+        data, self._pending = self._pending, bytearray()
+        # writeframesraw leaves the header alone; close() patches it once at the end
+        await asyncio.to_thread(self._wav.writeframesraw, data)
+    
     async def _save_recording(self):
-        if not self.audio_buffer or self.sample_rate is None or self.last_recording is None:
+        if self._wav is None or self.sample_rate is None or self.last_recording is None:
             return
         
-        audio_data = b''.join(self.audio_buffer)
-        bytes_per_sample = 2
-        bytes_per_frame = bytes_per_sample * self.num_channels
-        num_frames = len(audio_data) // bytes_per_frame
-        
-        recording_path = self.recordings_dir / self.last_recording
+        # Snapshot everything before the first await so the next recording can't race us
+        wav_file = self._wav
+        pending, self._pending = self._pending, bytearray()
+        self._wav = None
+        filename = self.last_recording
+        sample_rate = self.sample_rate
+        num_channels = self.num_channels
+        num_frames = self._sample_count
         
-        with wave.open(str(recording_path), 'wb') as wav_file:
-            wav_file.setnchannels(self.num_channels)
-            wav_file.setsampwidth(bytes_per_sample)
-            wav_file.setframerate(self.sample_rate)
-            wav_file.writeframes(audio_data)
+        recording_path = self.recordings_dir / filename
+        meta = {
+            "filename": filename,
+            "timestamp": datetime.now().isoformat(),
+            "voice_name": self.current_voice['name'],
+            "voice_description": self.current_voice['description'],
+            "duration": num_frames / sample_rate,
+            "sample_rate": sample_rate,
+            "channels": num_channels,
+            "text": self.last_recording_text or ""
+        }
         
-        meta_path = recording_path.with_suffix(".json")
-        with open(meta_path, 'w') as f:
-            json.dump({
-                "filename": self.last_recording,
-                "timestamp": datetime.now().isoformat(),
-                "voice_name": self.current_voice['name'],
-                "voice_description": self.current_voice['description'],
-                "duration": num_frames / self.sample_rate,
-                "sample_rate": self.sample_rate,
-                "channels": self.num_channels,
-                "text": self.last_recording_text or ""
-            }, f, indent=2)
+        # File I/O runs on a worker thread so the audio pipeline keeps flowing.
+        # Closing finalizes the WAV header with the real frame count.
+        await asyncio.to_thread(_finish_wav, wav_file, pending)
+        await asyncio.to_thread(_write_meta, recording_path.with_suffix(".json"), meta)
+        self._index_recording(filename, meta)
         
-        logger.info(f"Saved {self.last_recording}: {num_frames / self.sample_rate:.2f}s")
+        logger.info(f"Saved {filename}: {num_frames / sample_rate:.2f}s")
     
     async def on_enter(self):
         if self._should_greet:
@@ -261,5 +364,5 @@ async def entrypoint(ctx: JobContext):
     )
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
 
@@ -1,11 +1,14 @@
 """
 Simple example agent that plays a pre-recorded greeting when user connects.
 """
+import asyncio
+import functools
 import logging
 import wave
 from pathlib import Path
+from typing import AsyncIterator
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli
 from livekit.agents.voice import Agent, AgentSession
 from livekit.plugins import silero
 from livekit import rtc
@@ -18,6 +21,48 @@ load_dotenv(dotenv_path=Path(__file__).parent.parent / '.env')
 # File name to play
 GREETING_FILE = Path(__file__).parent / "recordings" / "greeting.wav"
 
+# Playback is streamed in chunks of this many milliseconds
+PLAYBACK_CHUNK_MS = 20
+# ...read from disk this many chunks (0.5s) at a time
+PLAYBACK_READ_CHUNKS = 25
+
+
+async def stream_wav(path: Path) -> AsyncIterator[rtc.AudioFrame]:
+    """Yield a WAV file as short audio frames, reading large blocks off the event loop."""
+    with wave.open(str(path), 'rb') as wav_file:
+        num_channels = wav_file.getnchannels()
+        sample_rate = wav_file.getframerate()
+        bytes_per_frame = wav_file.getsampwidth() * num_channels
+        chunk_frames = sample_rate * PLAYBACK_CHUNK_MS // 1000
+        chunk_bytes = chunk_frames * bytes_per_frame
+        read_frames = chunk_frames * PLAYBACK_READ_CHUNKS
+        
+        while True:
+            # One thread hop per block; slicing it into frames is cheap on the loop
+            block = await asyncio.to_thread(wav_file.readframes, read_frames)
+            if not block:
+                break
+            view = memoryview(block)
+            for start in range(0, len(block), chunk_bytes):
+                data = view[start:start + chunk_bytes]
+                yield rtc.AudioFrame(
+                    data=data,
+                    sample_rate=sample_rate,
+                    num_channels=num_channels,
+                    samples_per_channel=len(data) // bytes_per_frame
+                )
+
+
+@functools.cache
+def load_vad() -> silero.VAD:
+    """Load the VAD model once per process and share it across agent instances."""
+    return silero.VAD.load()
+
+
+def prewarm(proc: JobProcess):
+    load_vad()
+
+
 class ExampleAgent(Agent):
     def __init__(self) -> None:
         super().__init__(
@@ -25,7 +70,7 @@ class ExampleAgent(Agent):
             stt="assemblyai/universal-streaming",
             llm="openai/gpt-4.1-mini",
             tts="inworld/inworld-tts-1:Ashley",
-            vad=silero.VAD.load()
+            vad=load_vad()
         )
     
     async def on_enter(self):
@@ -36,29 +81,13 @@ class ExampleAgent(Agent):
             await self.session.say("Looks like there's no greeting recorded yet. Please record a greeting first.")
     
     async def _play_greeting(self):
-        with wave.open(str(GREETING_FILE), 'rb') as wav_file:
-            num_channels = wav_file.getnchannels()
-            sample_rate = wav_file.getframerate()
-            frames = wav_file.readframes(wav_file.getnframes())
-            num_frames = wav_file.getnframes()
-
-        audio_frame = rtc.AudioFrame(
-            data=frames,
-            sample_rate=sample_rate,
-            num_channels=num_channels,
-            samples_per_channel=num_frames
-        )
-
-        async def audio_generator():
-            yield audio_frame
-
         # allow_interruptions is blocking the user from interrupting agent while it's playing the greeting recording
-        await self.session.say("", audio=audio_generator(), allow_interruptions=False)
+        await self.session.say("", audio=stream_wav(GREETING_FILE), allow_interruptions=False)
 
 async def entrypoint(ctx: JobContext):
     session = AgentSession()
     await session.start(agent=ExampleAgent(), room=ctx.room)
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
 
@@ -1,5 +1,5 @@
-from .sms_agent import SMSAgent, SMSResult, SMSContext, process_sms
-from .context_manager import ContextManager
+from .sms_agent import SMSAgent, SMSResult, SMSContext, process_sms, skip_reason
+from .context_manager import ContextManager, RedisContextManager, create_context_manager
 from .twilio_utils import (
     TwilioConfig,
     SendSMSResult,
@@ -8,6 +8,9 @@ from .twilio_utils import (
     get_phone_number_info,
     update_sms_webhook_url,
     ensure_sms_webhook,
+    ensure_sms_webhooks,
+    read_webhook_form,
+    empty_twiml_response,
 )
 
 __all__ = [
@@ -15,7 +18,10 @@ __all__ = [
     "SMSResult",
     "SMSContext",
     "process_sms",
+    "skip_reason",
     "ContextManager",
+    "RedisContextManager",
+    "create_context_manager",
     "TwilioConfig",
     "SendSMSResult",
     "send_sms",
@@ -23,4 +29,7 @@ __all__ = [
     "get_phone_number_info",
     "update_sms_webhook_url",
     "ensure_sms_webhook",
+    "ensure_sms_webhooks",
+    "read_webhook_form",
+    "empty_twiml_response",
 ]
@@ -1,45 +1,280 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
+import os
+from collections import Counter, OrderedDict
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import quote
 
-from livekit.agents.llm import ChatContext
+import orjson
+from livekit.agents.llm import ChatContext, ChatItem
+
+logger = logging.getLogger(__name__)
+
+# Conversations kept parsed in memory; older ones are re-read from disk on demand
+CACHE_SIZE = 1024
+
+# Redis conversations expire after a week without messages
+CONTEXT_TTL = 7 * 24 * 60 * 60
 
 
 class ContextManager:
-    def __init__(self, file_path: Path | str | None = None):
-        self.file_path = Path(file_path) if file_path else Path(__file__).parent.parent / "conversations.json"
-        self._data: dict[str, dict] = {}
-        self._load()
+    """Stores one JSON file per phone number, replaced atomically on save.
+
+    Shards are read lazily on first access and kept in a small LRU cache.
+    """
 
-    def _load(self) -> None:
-        if not self.file_path.exists():
+    def __init__(self, dir_path: Path | str | None = None, cache_size: int = CACHE_SIZE):
+        self.dir_path = Path(dir_path) if dir_path else Path(__file__).parent.parent / "conversations"
+        self.dir_path.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size
+        self._data: OrderedDict[str, dict] = OrderedDict()
+        # Write locks exist only while a write for that number holds or waits on
+        # them, so they don't outgrow the cache
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._lock_users: Counter[str] = Counter()
+        self._migrate_legacy_file(self.dir_path.with_suffix(".json"))
+
+    def _migrate_legacy_file(self, legacy_path: Path) -> None:
+        """Split a single-file store (conversations.json) into shards, once.
+
+        Shards that already exist are newer and are kept. The old file is renamed
+        afterwards so the migration doesn't run again.
+        """
+        if not legacy_path.is_file():
+            return
+        try:
+            legacy = orjson.loads(legacy_path.read_bytes())
+        except orjson.JSONDecodeError:
+            logger.warning("Could not parse %s; leaving it in place", legacy_path)
             return
+        migrated = 0
+        for phone_number, entry in legacy.items():
+            if not self._shard_path(phone_number).exists():
+                self._write_shard(phone_number, entry)
+                migrated += 1
+        legacy_path.replace(legacy_path.with_name(legacy_path.name + ".migrated"))
+        logger.info("Migrated %s conversations from %s", migrated, legacy_path)
+
+    def _shard_path(self, phone_number: str) -> Path:
+        # Quote so arbitrary sender IDs (e.g. "whatsapp:+1...") are safe file names
+        return self.dir_path / f"{quote(phone_number, safe='+')}.json"
+
+    def _cache(self, phone_number: str, entry: dict) -> None:
+        self._data[phone_number] = entry
+        self._data.move_to_end(phone_number)
+        while len(self._data) > self.cache_size:
+            self._data.popitem(last=False)
+
+    @asynccontextmanager
+    async def _locked(self, phone_number: str) -> AsyncIterator[None]:
+        """Serialize writes for one number, dropping the lock once nobody uses it."""
+        lock = self._locks.get(phone_number)
+        if lock is None:
+            lock = self._locks[phone_number] = asyncio.Lock()
+        self._lock_users[phone_number] += 1
         try:
-            with open(self.file_path) as f:
-                self._data = json.load(f)
-        except json.JSONDecodeError:
-            self._data = {}
+            async with lock:
+                yield
+        finally:
+            self._lock_users[phone_number] -= 1
+            if not self._lock_users[phone_number]:
+                del self._lock_users[phone_number]
+                del self._locks[phone_number]
 
-    def _save(self) -> None:
-        with open(self.file_path, "w") as f:
-            json.dump(self._data, f, indent=2)
+    def _read_shard(self, phone_number: str) -> dict | None:
+        try:
+            return orjson.loads(self._shard_path(phone_number).read_bytes())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return None
 
-    def save(self, phone_number: str, chat_ctx: ChatContext) -> None:
-        self._data[phone_number] = {
-            "chat_ctx": chat_ctx.to_dict(exclude_function_call=False),
+    def _cached_entry(self, phone_number: str) -> dict | None:
+        entry = self._data.get(phone_number)
+        if entry is not None:
+            self._data.move_to_end(phone_number)
+        return entry
+
+    def _entry(self, phone_number: str) -> dict | None:
+        entry = self._cached_entry(phone_number)
+        if entry is None:
+            entry = self._read_shard(phone_number)
+            if entry is not None:
+                self._cache(phone_number, entry)
+        return entry
+
+    async def _aentry(self, phone_number: str) -> dict | None:
+        """Like _entry(), but a cache miss reads the shard on a worker thread."""
+        entry = self._cached_entry(phone_number)
+        if entry is not None:
+            return entry
+        entry = await asyncio.to_thread(self._read_shard, phone_number)
+        if entry is None:
+            return None
+        # A write may have cached a newer entry while the file was being read
+        newer = self._cached_entry(phone_number)
+        if newer is not None:
+            return newer
+        self._cache(phone_number, entry)
+        return entry
+
+    def _write_shard(self, phone_number: str, entry: dict) -> None:
+        path = self._shard_path(phone_number)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps(entry))
+        tmp_path.replace(path)
+
+    @staticmethod
+    def _make_entry(chat_ctx_dict: dict) -> dict:
+        return {
+            "chat_ctx": chat_ctx_dict,
             "updated_at": datetime.now().isoformat(),
         }
-        self._save()
+
+    def save(self, phone_number: str, chat_ctx: ChatContext) -> None:
+        entry = self._make_entry(chat_ctx.to_dict(exclude_function_call=False))
+        self._cache(phone_number, entry)
+        self._write_shard(phone_number, entry)
+
+    async def asave(self, phone_number: str, chat_ctx: ChatContext) -> None:
+        """Like save(), but writes the file on a worker thread."""
+        await self.asave_dict(phone_number, chat_ctx.to_dict(exclude_function_call=False))
+
+    async def asave_dict(self, phone_number: str, chat_ctx_dict: dict) -> None:
+        """Store a history already in ChatContext.to_dict() form."""
+        entry = self._make_entry(chat_ctx_dict)
+        self._cache(phone_number, entry)
+        # Serialize writes per number so an older snapshot can't land last
+        async with self._locked(phone_number):
+            await asyncio.to_thread(self._write_shard, phone_number, entry)
+
+    async def aappend(self, phone_number: str, items: Sequence[ChatItem]) -> None:
+        """Add new items to the end of the stored history.
+
+        Only the new items are converted; the stored ones are reused as dicts.
+        """
+        if items:
+            await self.aappend_dict(phone_number, ChatContext(list(items)).to_dict(exclude_function_call=False)["items"])
+
+    async def aappend_dict(self, phone_number: str, new_items: list[dict]) -> None:
+        """Like aappend(), for items already in ChatContext.to_dict() form."""
+        if not new_items:
+            return
+        async with self._locked(phone_number):
+            existing = await self._aentry(phone_number)
+            old_items = existing["chat_ctx"]["items"] if existing and "chat_ctx" in existing else []
+            entry = {
+                "chat_ctx": {"items": old_items + new_items},
+                "updated_at": datetime.now().isoformat(),
+            }
+            self._cache(phone_number, entry)
+            await asyncio.to_thread(self._write_shard, phone_number, entry)
 
     def get(self, phone_number: str) -> ChatContext | None:
-        entry = self._data.get(phone_number)
+        entry = self._entry(phone_number)
         if not entry or "chat_ctx" not in entry:
             return None
         return ChatContext.from_dict(entry["chat_ctx"])
 
+    async def aget(self, phone_number: str) -> ChatContext | None:
+        chat_ctx_dict = await self.aget_dict(phone_number)
+        return ChatContext.from_dict(chat_ctx_dict) if chat_ctx_dict else None
+
+    async def aget_dict(self, phone_number: str) -> dict | None:
+        """The stored history in ChatContext.to_dict() form, without a round trip
+        through ChatContext. The returned dict is shared; don't mutate it."""
+        entry = await self._aentry(phone_number)
+        if not entry or "chat_ctx" not in entry:
+            return None
+        return entry["chat_ctx"]
+
     def clear(self, phone_number: str) -> None:
-        if phone_number in self._data:
-            del self._data[phone_number]
-            self._save()
+        self._data.pop(phone_number, None)
+        self._shard_path(phone_number).unlink(missing_ok=True)
+
+    async def aclear(self, phone_number: str) -> None:
+        self.clear(phone_number)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisContextManager:
+    """Stores each conversation as a Redis list of serialized items.
+
+    Shares history across processes and restarts. Requires the `redis` package.
+    """
+
+    KEY_PREFIX = "sms:history:"
+
+    def __init__(self, url: str, ttl: int = CONTEXT_TTL):
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("RedisContextManager requires the redis package: pip install redis") from e
+        self._redis = Redis.from_url(url, decode_responses=False)
+        self.ttl = ttl
+
+    def _key(self, phone_number: str) -> str:
+        return f"{self.KEY_PREFIX}{phone_number}"
+
+    async def aget(self, phone_number: str) -> ChatContext | None:
+        chat_ctx_dict = await self.aget_dict(phone_number)
+        return ChatContext.from_dict(chat_ctx_dict) if chat_ctx_dict else None
+
+    async def aget_dict(self, phone_number: str) -> dict | None:
+        """The stored history in ChatContext.to_dict() form."""
+        # One round trip for the whole history
+        values = await self._redis.lrange(self._key(phone_number), 0, -1)
+        if not values:
+            return None
+        return {"items": [orjson.loads(value) for value in values]}
+
+    async def asave(self, phone_number: str, chat_ctx: ChatContext) -> None:
+        await self.asave_dict(phone_number, chat_ctx.to_dict(exclude_function_call=False))
+
+    async def asave_dict(self, phone_number: str, chat_ctx_dict: dict) -> None:
+        """Store a history already in ChatContext.to_dict() form."""
+        key = self._key(phone_number)
+        items = chat_ctx_dict.get("items", [])
+        # MULTI/EXEC, so readers and other replicas never see a half-replaced list
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if items:
+                pipe.rpush(key, *(orjson.dumps(item) for item in items))
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def aappend(self, phone_number: str, items: Sequence[ChatItem]) -> None:
+        """Add new items to the end of the stored history, writing only those items."""
+        if items:
+            await self.aappend_dict(phone_number, ChatContext(list(items)).to_dict(exclude_function_call=False)["items"])
+
+    async def aappend_dict(self, phone_number: str, new_items: list[dict]) -> None:
+        """Like aappend(), for items already in ChatContext.to_dict() form."""
+        if not new_items:
+            return
+        key = self._key(phone_number)
+        # RPUSH is atomic on the server, so concurrent appends from any replica
+        # each land whole and in arrival order
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(orjson.dumps(item) for item in new_items))
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def aclear(self, phone_number: str) -> None:
+        await self._redis.delete(self._key(phone_number))
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+def create_context_manager() -> ContextManager | RedisContextManager:
+    """Use Redis when REDIS_URL is set, otherwise per-number JSON files."""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        return RedisContextManager(redis_url)
+    return ContextManager()
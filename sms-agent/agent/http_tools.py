@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import weakref
+from dataclasses import dataclass, field
 from typing import Any
 
 import aiohttp
+import orjson
 
 WEATHER_CODES = {
     0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
@@ -16,18 +19,80 @@ WEATHER_CODES = {
 }
 
 
+@dataclass(frozen=True)
+class Location:
+    """A geocoded place."""
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+
+
+# Geocoding results keyed by normalized city name; oldest entries are evicted
+GEO_CACHE_SIZE = 512
+_geo_cache: dict[str, Location] = {}
+
+
+@dataclass
+class _LoopSession:
+    session: aiohttp.ClientSession | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+# One session per event loop: worker jobs run in separate loops (threads or
+# processes), and a session can't be shared between loops
+_sessions: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopSession] = weakref.WeakKeyDictionary()
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Return this event loop's shared session, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    state = _sessions.get(loop)
+    if state is None:
+        state = _sessions[loop] = _LoopSession()
+
+    if state.session is None or state.session.closed:
+        async with state.lock:
+            if state.session is None or state.session.closed:
+                state.session = aiohttp.ClientSession(
+                    # Shared by tool calls and Twilio; keep idle connections long enough
+                    # that the next SMS reuses the TLS connection
+                    connector=aiohttp.TCPConnector(
+                        limit=100, limit_per_host=32, ttl_dns_cache=300, keepalive_timeout=75,
+                    ),
+                    # aiohttp already sends Accept-Encoding: gzip, deflate (br with brotli
+                    # installed) and decompresses responses
+                    headers={"User-Agent": "sms-agent/1.0"},
+                    json_serialize=lambda obj: orjson.dumps(obj).decode(),
+                )
+    return state.session
+
+
+async def close_http_session() -> None:
+    """Close this event loop's session. Call on application/job shutdown."""
+    state = _sessions.pop(asyncio.get_running_loop(), None)
+    if state is not None and state.session is not None and not state.session.closed:
+        await state.session.close()
+
+
 async def http_get(url: str, params: dict[str, Any] | None = None, timeout: int = 10) -> dict[str, Any]:
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=timeout) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return {"error": f"HTTP {resp.status}"}
+        session = await get_http_session()
+        async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            return {"error": f"HTTP {resp.status}"}
     except Exception as e:
         return {"error": str(e)}
 
 
-async def search_location(city: str) -> str:
+async def search_location(city: str) -> Location | str:
+    """Geocode a city name. Returns a Location, or an error message."""
+    key = city.strip().lower()
+    cached = _geo_cache.get(key)
+    if cached is not None:
+        return cached
+
     data = await http_get("https://geocoding-api.open-meteo.com/v1/search", params={"name": city, "count": 1})
 
     if "error" in data:
@@ -38,12 +103,21 @@ async def search_location(city: str) -> str:
         return f"Could not find location: {city}"
 
     r = results[0]
-    return json.dumps({
-        "name": r.get("name"),
-        "country": r.get("country"),
-        "latitude": r.get("latitude"),
-        "longitude": r.get("longitude"),
-    })
+    lat, lon = r.get("latitude"), r.get("longitude")
+    if lat is None or lon is None:
+        return f"No coordinates found for {city}"
+
+    location = Location(
+        name=r.get("name") or city,
+        country=r.get("country") or "",
+        latitude=lat,
+        longitude=lon,
+    )
+
+    if len(_geo_cache) >= GEO_CACHE_SIZE:
+        del _geo_cache[next(iter(_geo_cache))]
+    _geo_cache[key] = location
+    return location
 
 
 async def get_weather(latitude: float, longitude: float) -> str:
@@ -74,22 +148,11 @@ async def get_weather(latitude: float, longitude: float) -> str:
 
 
 async def get_weather_by_city(city: str) -> str:
-    location_json = await search_location(city)
-
-    if location_json.startswith("Error") or location_json.startswith("Could not"):
-        return location_json
-
-    try:
-        location = json.loads(location_json)
-    except json.JSONDecodeError:
-        return f"Failed to parse location data for {city}"
-
-    lat, lon = location.get("latitude"), location.get("longitude")
-    if lat is None or lon is None:
-        return f"No coordinates found for {city}"
+    location = await search_location(city)
+    if isinstance(location, str):
+        return location
 
-    weather = await get_weather(lat, lon)
-    name = location.get("name", city)
-    country = location.get("country", "")
+    weather = await get_weather(location.latitude, location.longitude)
+    name, country = location.name, location.country
 
     return f"{name}, {country}: {weather}" if country else f"{name}: {weather}"
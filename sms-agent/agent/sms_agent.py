@@ -1,17 +1,73 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
+import re
+import weakref
 from dataclasses import dataclass
+from itertools import chain
 
 from livekit.agents import AgentSession, AgentTask, RunContext, RunResult, function_tool
 from livekit.agents.llm import ChatContext
 
-from .context_manager import ContextManager
+from .context_manager import ContextManager, RedisContextManager
 from .http_tools import get_weather_by_city
 from .twilio_utils import TwilioConfig, send_sms
 
 logger = logging.getLogger(__name__)
 
+# Caps concurrent agent runs so a burst of messages can't open unbounded LLM/Twilio connections
+MAX_CONCURRENCY = int(os.getenv("SMS_MAX_CONCURRENCY", "32"))
+# Per event loop, like the Twilio semaphore: a semaphore is bound to the loop that first waits on it
+_process_sems: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def _process_sem() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _process_sems.get(loop)
+    if sem is None:
+        sem = _process_sems[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return sem
+
+
+# Messages the agent would skip anyway; matched before any LLM call
+_OPT_OUT_RE = re.compile(r"^\s*(stop|stopall|unsubscribe|end|cancel|quit|revoke|optout)\W*$", re.IGNORECASE)
+# Twilio answers these keywords itself on long codes and short codes
+_CARRIER_KEYWORD_RE = re.compile(r"^\s*(start|unstop|help|info)\W*$", re.IGNORECASE)
+# Verification-code notifications, matched on how senders word them: the message
+# opens with the code phrase, and the code ends a sentence. People also write
+# "your zip code is 94103 right?" or "Your pin: 1234 doesn't work", so neither a
+# code word plus digits nor a loose "your ... code" is enough.
+_OTP_CODE = r"(?:\d{4,8}|\d{3}[- ]\d{3})"
+_OTP_CODE_END = r"\s*(?:[.!\n]|$)"
+_OTP_KIND = r"(?:verification|security|login|sign-in|one-time|confirmation|access)"
+# A capitalized brand, e.g. "Your WhatsApp code is"
+_OTP_BRAND = r"(?:(?-i:[A-Z][\w&'.-]*)\s+)?"
+_AUTOMATED_RE = re.compile(
+    r"^\W*(?:"
+    rf"your\s+{_OTP_BRAND}(?:{_OTP_KIND}\s+)?(?:code|passcode|otp)\s*(?:is\b|:)\s*{_OTP_CODE}{_OTP_CODE_END}"
+    rf"|{_OTP_KIND}\s+(?:code|passcode)\s*(?:is\b|:)\s*{_OTP_CODE}{_OTP_CODE_END}"
+    rf"|otp\s*(?:is\b|:)\s*{_OTP_CODE}{_OTP_CODE_END}"
+    rf"|(?:[A-Z]-)?{_OTP_CODE}\s+is\s+your\s+{_OTP_BRAND}(?:{_OTP_KIND}\s+)?(?:code|passcode|otp)\b"
+    r")",
+    re.IGNORECASE,
+)
+
+
+def skip_reason(body: str) -> str | None:
+    """Return why a message needs no reply, or None if the agent should handle it."""
+    if not body.strip():
+        return "empty message"
+    if _OPT_OUT_RE.match(body):
+        return "opt-out request"
+    if _CARRIER_KEYWORD_RE.match(body):
+        return "carrier keyword"
+    match = _AUTOMATED_RE.match(body)
+    if match:
+        return f"automated message ({match.group(0).strip()!r})"
+    return None
+
 
 @dataclass
 class SMSResult:
@@ -24,7 +80,7 @@ class SMSResult:
 class SMSContext:
     phone_number: str
     incoming_message: str
-    context_manager: ContextManager
+    context_manager: ContextManager | RedisContextManager
     twilio_config: TwilioConfig
 
 
@@ -58,30 +114,30 @@ class SMSAgent(AgentTask[SMSResult]):
     @function_tool()
     async def get_weather(self, context: RunContext[SMSContext], city: str) -> str:
         """Get current weather for a city."""
-        logger.info(f"Getting weather for: {city}")
+        logger.info("Getting weather for: %s", city)
         result = await get_weather_by_city(city)
-        logger.info(f"Weather result: {result}")
+        logger.info("Weather result: %s", result)
         return result
 
     @function_tool()
     async def send_sms(self, context: RunContext[SMSContext], message: str) -> None:
         """Send an SMS reply to the user."""
         ctx: SMSContext = context.session.userdata
-        logger.info(f"Sending SMS to {ctx.phone_number}: {message}")
+        logger.info("Sending SMS to %s: %s", ctx.phone_number, message)
 
         result = await send_sms(ctx.twilio_config, ctx.phone_number, message)
 
         if result.success:
-            logger.info(f"SMS sent, SID: {result.message_sid}")
+            logger.info("SMS sent, SID: %s", result.message_sid)
             self.complete(SMSResult(action="sent", message=message))
         else:
-            logger.error(f"SMS failed: {result.error}")
+            logger.error("SMS failed: %s", result.error)
             self.complete(SMSResult(action="error", reason=result.error))
 
     @function_tool()
     async def skip_response(self, context: RunContext[SMSContext], reason: str) -> None:
         """Skip responding to this message."""
-        logger.info(f"Skipping: {reason}")
+        logger.info("Skipping: %s", reason)
         self.complete(SMSResult(action="skipped", reason=reason))
 
 
@@ -89,17 +145,37 @@ async def process_sms(
     from_number: str,
     to_number: str,
     body: str,
-    context_manager: ContextManager,
+    context_manager: ContextManager | RedisContextManager,
     twilio_config: TwilioConfig,
 ) -> SMSResult:
     """Process an incoming SMS and generate a response."""
-    logger.info(f"Incoming SMS from {from_number}: {body}")
+    logger.info("Incoming SMS from %s: %s", from_number, body)
 
-    reply_config = TwilioConfig(
-        account_sid=twilio_config.account_sid,
-        auth_token=twilio_config.auth_token,
-        from_number=to_number or twilio_config.from_number,
-    )
+    reason = skip_reason(body)
+    if reason:
+        logger.info("Skipping %s without agent: %s", from_number, reason)
+        return SMSResult(action="skipped", reason=reason)
+
+    async with _process_sem():
+        return await _run_agent(from_number, to_number, body, context_manager, twilio_config)
+
+
+async def _run_agent(
+    from_number: str,
+    to_number: str,
+    body: str,
+    context_manager: ContextManager | RedisContextManager,
+    twilio_config: TwilioConfig,
+) -> SMSResult:
+    # Reply from the number that was texted; usually that's the configured one
+    if not to_number or to_number == twilio_config.from_number:
+        reply_config = twilio_config
+    else:
+        reply_config = TwilioConfig(
+            account_sid=twilio_config.account_sid,
+            auth_token=twilio_config.auth_token,
+            from_number=to_number,
+        )
 
     sms_context = SMSContext(
         phone_number=from_number,
@@ -109,9 +185,9 @@ async def process_sms(
     )
 
     # Load conversation history
-    saved_ctx = context_manager.get(from_number)
+    saved_ctx = await context_manager.aget(from_number)
     if saved_ctx:
-        logger.info(f"Restored {len(saved_ctx.items)} history items")
+        logger.info("Restored %s history items", len(saved_ctx.items))
     else:
         logger.info("No history, starting fresh")
 
@@ -127,34 +203,44 @@ async def process_sms(
             result: RunResult[SMSResult] = await session.run(user_input=body, output_type=SMSResult)
             sms_result = result.final_output
         except RuntimeError as e:
-            logger.warning(f"Agent didn't call tool: {e}")
+            logger.warning("Agent didn't call tool: %s", e)
 
-        # Merge old history + new items and save
+        # Session history holds only this turn's items; store just those
         old_items = saved_ctx.items if saved_ctx else []
         new_items = session.history.items
-        all_items = list(old_items) + list(new_items)
-        context_manager.save(from_number, ChatContext(all_items))
-
-        # Log stats
-        user_msgs = sum(1 for i in all_items if i.type == "message" and i.role == "user")
-        tool_calls = sum(1 for i in all_items if i.type == "function_call")
-        logger.info(f"Context: {len(all_items)} items | {user_msgs} user msgs | {tool_calls} tool calls")
+        await context_manager.aappend(from_number, new_items)
+
+        # Stats walk the whole history, so only compute them when they'll be logged
+        if logger.isEnabledFor(logging.INFO):
+            user_msgs = tool_calls = 0
+            for item in chain(old_items, new_items):
+                if item.type == "message" and item.role == "user":
+                    user_msgs += 1
+                elif item.type == "function_call":
+                    tool_calls += 1
+            logger.info(
+                "Context: %s items | %s user msgs | %s tool calls",
+                len(old_items) + len(new_items), user_msgs, tool_calls,
+            )
 
         if sms_result:
             return sms_result
 
-        # Fallback: if agent generated text but forgot to call send_sms, send it anyway
-        for item in reversed(session.history.items):
-            if item.type == "message" and item.role == "assistant":
-                text = item.content[0] if item.content else None
-                if text and isinstance(text, str):
-                    logger.info(f"Fallback: sending assistant message as SMS: {text}")
-                    send_result = await send_sms(reply_config, from_number, text)
-                    if send_result.success:
-                        return SMSResult(action="sent", message=text)
-                    logger.error(f"Fallback failed: {send_result.error}")
-                    return SMSResult(action="error", reason=send_result.error)
-                break
+        # Fallback: if agent generated text but forgot to call send_sms, send it anyway.
+        # Only this turn's items can hold it, and the latest one is near the end.
+        last_assistant_msg = next(
+            (item for item in reversed(new_items) if item.type == "message" and item.role == "assistant"),
+            None,
+        )
+        if last_assistant_msg is not None:
+            text = last_assistant_msg.content[0] if last_assistant_msg.content else None
+            if text and isinstance(text, str):
+                logger.info("Fallback: sending assistant message as SMS: %s", text)
+                send_result = await send_sms(reply_config, from_number, text)
+                if send_result.success:
+                    return SMSResult(action="sent", message=text)
+                logger.error("Fallback failed: %s", send_result.error)
+                return SMSResult(action="error", reason=send_result.error)
 
         logger.error("No output from agent")
         return SMSResult(action="error", reason="No output from agent")
@@ -1,14 +1,39 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import weakref
 from dataclasses import dataclass
-from urllib.parse import quote
+from functools import cached_property
+from pathlib import Path
+from urllib.parse import parse_qsl, quote
 
 import aiohttp
+import orjson
+from aiohttp import web
+
+from .http_tools import get_http_session
 
 logger = logging.getLogger(__name__)
 
+# Caps in-flight Twilio requests; keep below the shared connector's limit
+TWILIO_MAX_CONCURRENCY = int(os.getenv("TWILIO_MAX_CONCURRENCY", "16"))
+# Per event loop, like the HTTP session: a semaphore is bound to the loop that first waits on it
+_twilio_sems: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def _twilio_sem() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _twilio_sems.get(loop)
+    if sem is None:
+        sem = _twilio_sems[loop] = asyncio.Semaphore(TWILIO_MAX_CONCURRENCY)
+    return sem
+
+# Last webhook URL confirmed per phone number, so restarts skip the Twilio round trips.
+# Delete it to re-check a webhook changed in the Twilio console.
+WEBHOOK_CACHE_PATH = Path(__file__).parent.parent / ".sms_webhook_cache.json"
+
 
 @dataclass
 class TwilioConfig:
@@ -27,6 +52,26 @@ class TwilioConfig:
     def is_configured(self) -> bool:
         return bool(self.account_sid and self.auth_token and self.from_number)
 
+    @cached_property
+    def auth(self) -> aiohttp.BasicAuth:
+        return aiohttp.BasicAuth(self.account_sid, self.auth_token)
+
+
+async def read_webhook_form(request: web.Request) -> dict[str, str]:
+    """Parse a Twilio webhook body.
+
+    Twilio posts a few small urlencoded fields, so parse them directly rather than
+    through aiohttp's multipart-capable form reader.
+    """
+    if request.content_type == "application/x-www-form-urlencoded":
+        return dict(parse_qsl(await request.text(), keep_blank_values=True))
+    return {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+
+
+def empty_twiml_response() -> web.Response:
+    """Acknowledge a Twilio webhook without sending a reply message."""
+    return web.Response(text="<Response/>", content_type="application/xml")
+
 
 @dataclass
 class SendSMSResult:
@@ -41,17 +86,18 @@ async def send_sms(config: TwilioConfig, to_number: str, message: str, timeout:
         return SendSMSResult(success=False, error="Twilio not configured")
 
     url = f"https://api.twilio.com/2010-04-01/Accounts/{config.account_sid}/Messages.json"
-    auth = aiohttp.BasicAuth(config.account_sid, config.auth_token)
     payload = {"To": to_number, "From": config.from_number, "Body": message}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, auth=auth, data=payload, timeout=timeout) as resp:
-                if resp.status in (200, 201):
-                    result = await resp.json()
-                    return SendSMSResult(success=True, message_sid=result.get("sid"))
-                error = await resp.text()
-                return SendSMSResult(success=False, error=f"HTTP {resp.status}: {error}")
+        session = await get_http_session()
+        async with _twilio_sem(), session.post(
+            url, auth=config.auth, data=payload, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            if resp.status in (200, 201):
+                result = await resp.json()
+                return SendSMSResult(success=True, message_sid=result.get("sid"))
+            error = await resp.text()
+            return SendSMSResult(success=False, error=f"HTTP {resp.status}: {error}")
     except aiohttp.ClientError as e:
         return SendSMSResult(success=False, error=f"Network error: {e}")
     except Exception as e:
@@ -75,33 +121,32 @@ async def get_phone_number_info(config: TwilioConfig, timeout: int = 30) -> Phon
     # URL-encode the phone number for the query parameter
     encoded_number = quote(config.from_number, safe="")
     url = f"https://api.twilio.com/2010-04-01/Accounts/{config.account_sid}/IncomingPhoneNumbers.json?PhoneNumber={encoded_number}"
-    auth = aiohttp.BasicAuth(config.account_sid, config.auth_token)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, auth=auth, timeout=timeout) as resp:
-                if resp.status != 200:
-                    error = await resp.text()
-                    logger.error(f"Failed to get phone number info: HTTP {resp.status}: {error}")
-                    return None
-
-                data = await resp.json()
-                numbers = data.get("incoming_phone_numbers", [])
-                if not numbers:
-                    logger.error(f"Phone number {config.from_number} not found in account")
-                    return None
-
-                number_info = numbers[0]
-                return PhoneNumberInfo(
-                    sid=number_info.get("sid", ""),
-                    phone_number=number_info.get("phone_number", ""),
-                    sms_url=number_info.get("sms_url"),
-                )
+        session = await get_http_session()
+        async with session.get(url, auth=config.auth, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                error = await resp.text()
+                logger.error("Failed to get phone number info: HTTP %s: %s", resp.status, error)
+                return None
+
+            data = await resp.json()
+            numbers = data.get("incoming_phone_numbers", [])
+            if not numbers:
+                logger.error("Phone number %s not found in account", config.from_number)
+                return None
+
+            number_info = numbers[0]
+            return PhoneNumberInfo(
+                sid=number_info.get("sid", ""),
+                phone_number=number_info.get("phone_number", ""),
+                sms_url=number_info.get("sms_url"),
+            )
     except aiohttp.ClientError as e:
-        logger.error(f"Network error getting phone info: {e}")
+        logger.error("Network error getting phone info: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Error getting phone info: {e}")
+        logger.error("Error getting phone info: %s", e)
         return None
 
 
@@ -112,32 +157,54 @@ async def update_sms_webhook_url(config: TwilioConfig, phone_sid: str, sms_url:
         return False
 
     url = f"https://api.twilio.com/2010-04-01/Accounts/{config.account_sid}/IncomingPhoneNumbers/{phone_sid}.json"
-    auth = aiohttp.BasicAuth(config.account_sid, config.auth_token)
     payload = {"SmsUrl": sms_url}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, auth=auth, data=payload, timeout=timeout) as resp:
-                if resp.status in (200, 201):
-                    logger.info(f"Updated SMS webhook URL to: {sms_url}")
-                    return True
-                error = await resp.text()
-                logger.error(f"Failed to update SMS webhook: HTTP {resp.status}: {error}")
-                return False
+        session = await get_http_session()
+        async with session.post(
+            url, auth=config.auth, data=payload, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            if resp.status in (200, 201):
+                logger.info("Updated SMS webhook URL to: %s", sms_url)
+                return True
+            error = await resp.text()
+            logger.error("Failed to update SMS webhook: HTTP %s: %s", resp.status, error)
+            return False
     except aiohttp.ClientError as e:
-        logger.error(f"Network error updating webhook: {e}")
+        logger.error("Network error updating webhook: %s", e)
         return False
     except Exception as e:
-        logger.error(f"Error updating webhook: {e}")
+        logger.error("Error updating webhook: %s", e)
         return False
 
 
-async def ensure_sms_webhook(config: TwilioConfig, webhook_url: str) -> bool:
+def _load_webhook_cache() -> dict[str, str]:
+    try:
+        return orjson.loads(WEBHOOK_CACHE_PATH.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+
+def _remember_webhook(phone_number: str, sms_url: str) -> None:
+    cache = _load_webhook_cache()
+    cache[phone_number] = sms_url
+    try:
+        WEBHOOK_CACHE_PATH.write_bytes(orjson.dumps(cache))
+    except OSError as e:
+        logger.warning("Could not write webhook cache: %s", e)
+
+
+async def ensure_sms_webhook(config: TwilioConfig, webhook_url: str, use_cache: bool = True) -> bool:
     """Ensure the SMS webhook URL is set correctly for the configured phone number.
     
     Returns True if webhook is already correct or was successfully updated.
+    With use_cache, a URL confirmed on a previous run is trusted without asking Twilio.
     """
     expected_url = f"{webhook_url.rstrip('/')}/webhook/twilio/receive"
+
+    if use_cache and _load_webhook_cache().get(config.from_number) == expected_url:
+        logger.info("SMS webhook already configured (cached): %s", expected_url)
+        return True
     
     # Get current phone number info
     phone_info = await get_phone_number_info(config)
@@ -147,9 +214,26 @@ async def ensure_sms_webhook(config: TwilioConfig, webhook_url: str) -> bool:
 
     # Check if webhook URL already matches
     if phone_info.sms_url == expected_url:
-        logger.info(f"SMS webhook already configured: {expected_url}")
+        logger.info("SMS webhook already configured: %s", expected_url)
+        _remember_webhook(config.from_number, expected_url)
         return True
 
     # Update webhook URL
-    logger.info(f"Updating SMS webhook from '{phone_info.sms_url}' to '{expected_url}'")
-    return await update_sms_webhook_url(config, phone_info.sid, expected_url)
+    logger.info("Updating SMS webhook from '%s' to '%s'", phone_info.sms_url, expected_url)
+    updated = await update_sms_webhook_url(config, phone_info.sid, expected_url)
+    if updated:
+        _remember_webhook(config.from_number, expected_url)
+    return updated
+
+
+async def ensure_sms_webhooks(
+    configs: list[TwilioConfig], webhook_url: str, max_concurrency: int = 10
+) -> list[bool]:
+    """Run ensure_sms_webhook for several numbers at once, at most max_concurrency in flight."""
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _ensure(config: TwilioConfig) -> bool:
+        async with sem:
+            return await ensure_sms_webhook(config, webhook_url)
+
+    return list(await asyncio.gather(*(_ensure(config) for config in configs)))
@@ -13,29 +13,44 @@ Environment Variables:
     TWILIO_ACCOUNT_SID: Twilio account SID
     TWILIO_AUTH_TOKEN: Twilio auth token
     TWILIO_PHONE_NUMBER: Twilio phone number
+    TWILIO_PHONE_NUMBERS: Optional comma-separated numbers whose webhooks to configure
+        (default: TWILIO_PHONE_NUMBER)
     LIVEKIT_URL: LiveKit server URL
     LIVEKIT_API_KEY: LiveKit API key
     LIVEKIT_API_SECRET: LiveKit API secret
+    REDIS_URL: Optional Redis URL for conversation storage (default: local JSON files)
 """
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import os
-import uuid
+import secrets
+import sys
+from dataclasses import replace
 from pathlib import Path
 
+import orjson
 from aiohttp import web
 from dotenv import load_dotenv
 from livekit import api
-from livekit.agents.llm import ChatContext
 
 local_env = Path(__file__).parent / ".env"
 root_env = Path(__file__).parent.parent / ".env"
 load_dotenv(local_env if local_env.exists() else root_env)
 
-from agent import ContextManager, TwilioConfig, ensure_sms_webhook
+from agent import (
+    ContextManager,
+    RedisContextManager,
+    TwilioConfig,
+    create_context_manager,
+    empty_twiml_response,
+    ensure_sms_webhooks,
+    read_webhook_form,
+    skip_reason,
+)
+from agent.http_tools import close_http_session
 
 logging.basicConfig(
     level=logging.INFO,
@@ -49,7 +64,10 @@ logger = logging.getLogger(__name__)
 
 PORT = int(os.getenv("SMS_AGENT_PORT", "5000"))
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+AGENT_CALLBACK_URL = f"{WEBHOOK_URL.rstrip('/')}/webhook/agent/complete" if WEBHOOK_URL else ""
 AGENT_NAME = "sms-agent"
+# Every number this server answers for; replies go out from the number that was texted
+TWILIO_PHONE_NUMBERS = [n.strip() for n in os.getenv("TWILIO_PHONE_NUMBERS", "").split(",") if n.strip()]
 
 # Maximum metadata size (50KB to be safe, well under 64KB limit)
 MAX_METADATA_SIZE = 50 * 1024
@@ -65,22 +83,30 @@ def truncate_context(chat_ctx_dict: dict, max_size: int = MAX_METADATA_SIZE) ->
         return chat_ctx_dict
     
     # Try full context first
-    test_json = json.dumps(chat_ctx_dict)
-    if len(test_json.encode("utf-8")) <= max_size:
+    test_json = orjson.dumps(chat_ctx_dict)
+    if len(test_json) <= max_size:
         return chat_ctx_dict
     
     # Truncate from the beginning (keep recent messages)
-    logger.warning(f"Context too large ({len(test_json)} bytes), truncating...")
-    while items and len(json.dumps({"items": items}).encode("utf-8")) > max_size - 1024:
-        items = items[1:]  # Remove oldest item
+    logger.warning("Context too large (%s bytes), truncating...", len(test_json))
+    # Size each item once, then drop the oldest until the rest fits. orjson
+    # joins items with "," so every item but the last adds 1 byte.
+    sizes = [len(orjson.dumps(item)) for item in items]
+    total = len(orjson.dumps({"items": []})) + sum(sizes) + len(items) - 1
+    start = 0
+    while start < len(items) and total > max_size - 1024:
+        total -= sizes[start] + (1 if start < len(items) - 1 else 0)
+        start += 1
+    items = items[start:]
     
-    logger.info(f"Truncated to {len(items)} items")
+    logger.info("Truncated to %s items", len(items))
     return {"items": items}
 
 
 async def dispatch_sms_agent(
     app: web.Application,
     phone_number: str,
+    to_number: str,
     incoming_message: str,
     chat_context: dict | None,
 ) -> str | None:
@@ -94,11 +120,11 @@ async def dispatch_sms_agent(
     metadata = {
         "phone_number": phone_number,
         "incoming_message": incoming_message,
-        "callback_url": f"{WEBHOOK_URL.rstrip('/')}/webhook/agent/complete",
+        "callback_url": AGENT_CALLBACK_URL,
         "twilio_config": {
             "account_sid": twilio_config.account_sid,
             "auth_token": twilio_config.auth_token,
-            "from_number": twilio_config.from_number,
+            "from_number": to_number or twilio_config.from_number,
         },
     }
     
@@ -106,14 +132,19 @@ async def dispatch_sms_agent(
     if chat_context:
         metadata["chat_context"] = truncate_context(chat_context)
     
-    metadata_json = json.dumps(metadata)
-    logger.info(f"Metadata size: {len(metadata_json.encode('utf-8'))} bytes")
+    metadata_bytes = orjson.dumps(metadata)
+    logger.info("Metadata size: %s bytes", len(metadata_bytes))
+    metadata_json = metadata_bytes.decode()
     
     # Create unique room name for this SMS interaction
-    room_name = f"sms-{phone_number.replace('+', '')}-{uuid.uuid4().hex[:8]}"
+    room_name = f"sms-{phone_number.replace('+', '')}-{secrets.token_hex(4)}"
+    
+    lkapi: api.LiveKitAPI | None = app["lkapi"]
+    if lkapi is None:
+        logger.error("LiveKit not configured - can't dispatch agent")
+        return None
     
     try:
-        lkapi = api.LiveKitAPI()
         dispatch = await lkapi.agent_dispatch.create_dispatch(
             api.CreateAgentDispatchRequest(
                 agent_name=AGENT_NAME,
@@ -121,19 +152,18 @@ async def dispatch_sms_agent(
                 metadata=metadata_json,
             )
         )
-        await lkapi.aclose()
         
-        logger.info(f"Dispatched agent to room {room_name}, dispatch_id={dispatch.id}")
+        logger.info("Dispatched agent to room %s, dispatch_id=%s", room_name, dispatch.id)
         return dispatch.id
     except Exception as e:
-        logger.exception(f"Failed to dispatch agent: {e}")
+        logger.exception("Failed to dispatch agent: %s", e)
         return None
 
 
 async def handle_twilio_webhook(request: web.Request) -> web.Response:
     """Handle incoming SMS from Twilio webhook."""
     try:
-        data = await request.post()
+        data = await read_webhook_form(request)
         from_number = data.get("From", "")
         to_number = data.get("To", "")
         body = data.get("Body", "")
@@ -144,48 +174,52 @@ async def handle_twilio_webhook(request: web.Request) -> web.Response:
                 status=400,
             )
 
-        logger.info(f"Incoming SMS from {from_number}: {body}")
+        logger.info("Incoming SMS from %s: %s", from_number, body)
 
-        # Load existing context
-        # TODO: Replace with database query for production
-        # e.g., chat_context = await db.get_chat_context(from_number)
-        context_manager: ContextManager = request.app["context_manager"]
-        saved_ctx = context_manager.get(from_number)
-        chat_context = saved_ctx.to_dict(exclude_function_call=False) if saved_ctx else None
-        
-        if saved_ctx:
-            logger.info(f"Loaded {len(saved_ctx.items)} history items for {from_number}")
-
-        # Dispatch agent to process SMS
-        dispatch_id = await dispatch_sms_agent(
-            request.app,
-            from_number,
-            body,
-            chat_context,
-        )
+        # Opt-outs, carrier keywords and verification codes need no agent run at all
+        reason = skip_reason(body)
+        if reason:
+            logger.info("Skipping %s without dispatch: %s", from_number, reason)
+            return empty_twiml_response()
 
-        if dispatch_id:
-            return web.json_response({
-                "status": "dispatched",
-                "dispatch_id": dispatch_id,
-                "message": "Agent dispatched to process SMS",
-            })
-        else:
-            return web.json_response(
-                {"status": "error", "message": "Failed to dispatch agent"},
-                status=500,
-            )
+        # Answer Twilio right away; loading context and dispatching happen in the background
+        bg_tasks: set[asyncio.Task] = request.app["bg_tasks"]
+        task = asyncio.create_task(load_and_dispatch(request.app, from_number, to_number, body))
+        bg_tasks.add(task)
+        task.add_done_callback(bg_tasks.discard)
+
+        # The worker replies through the API, so Twilio just needs an empty TwiML ack
+        return empty_twiml_response()
 
     except Exception as e:
-        logger.exception(f"Webhook error: {e}")
+        logger.exception("Webhook error: %s", e)
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
+async def load_and_dispatch(app: web.Application, from_number: str, to_number: str, body: str) -> None:
+    """Load the sender's history and dispatch an agent for the message."""
+    try:
+        # Load existing context (Redis when REDIS_URL is set)
+        context_manager: ContextManager | RedisContextManager = app["context_manager"]
+        # Already in dict form, so no ChatContext round trip before dispatch
+        chat_context = await context_manager.aget_dict(from_number)
+        
+        if chat_context:
+            logger.info("Loaded %s history items for %s", len(chat_context.get('items', [])), from_number)
+
+        dispatch_id = await dispatch_sms_agent(app, from_number, to_number, body, chat_context)
+        if not dispatch_id:
+            logger.error("Failed to dispatch agent for %s", from_number)
+    except Exception as e:
+        logger.exception("Dispatch error for %s: %s", from_number, e)
+
+
 async def handle_agent_complete(request: web.Request) -> web.Response:
     """Handle agent completion callback - save updated context."""
     try:
-        data = await request.json()
+        data = orjson.loads(await request.read())
         phone_number = data.get("phone_number")
+        new_items = data.get("new_items")
         chat_context = data.get("chat_context")
         result = data.get("result", {})
 
@@ -195,16 +229,17 @@ async def handle_agent_complete(request: web.Request) -> web.Response:
                 status=400,
             )
 
-        logger.info(f"Agent completed for {phone_number}: {result.get('action', 'unknown')}")
+        logger.info("Agent completed for %s: %s", phone_number, result.get('action', 'unknown'))
 
-        # Save updated context
-        # TODO: Replace with database save for production
-        # e.g., await db.save_chat_context(phone_number, chat_context)
-        if chat_context:
-            context_manager: ContextManager = request.app["context_manager"]
-            ctx = ChatContext.from_dict(chat_context)
-            context_manager.save(phone_number, ctx)
-            logger.info(f"Saved {len(ctx.items)} context items for {phone_number}")
+        # Save updated context; the worker sends it in to_dict() form, so store it as is.
+        # Normally that's just this turn's items; a full chat_context replaces the history.
+        context_manager: ContextManager | RedisContextManager = request.app["context_manager"]
+        if new_items:
+            await context_manager.aappend_dict(phone_number, new_items)
+            logger.info("Appended %s context items for %s", len(new_items), phone_number)
+        elif chat_context:
+            await context_manager.asave_dict(phone_number, chat_context)
+            logger.info("Saved %s context items for %s", len(chat_context.get('items', [])), phone_number)
 
         return web.json_response({
             "status": "success",
@@ -212,7 +247,7 @@ async def handle_agent_complete(request: web.Request) -> web.Response:
         })
 
     except Exception as e:
-        logger.exception(f"Agent complete error: {e}")
+        logger.exception("Agent complete error: %s", e)
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
@@ -222,7 +257,14 @@ async def handle_health(request: web.Request) -> web.Response:
 
 
 async def on_startup(app: web.Application) -> None:
-    """Configure Twilio webhook on server startup."""
+    """Create the LiveKit API client and configure Twilio webhook on server startup."""
+    # One client for all dispatches; it needs a running loop, so create it here.
+    # Without credentials the server still runs (main() warns); dispatches fail.
+    if all(os.getenv(name) for name in ("LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET")):
+        app["lkapi"] = api.LiveKitAPI()
+    else:
+        app["lkapi"] = None
+
     if not WEBHOOK_URL:
         logger.warning("WEBHOOK_URL not set - skipping Twilio webhook auto-configuration")
         return
@@ -232,27 +274,41 @@ async def on_startup(app: web.Application) -> None:
         logger.warning("Twilio not configured - skipping webhook auto-configuration")
         return
 
-    logger.info("Checking Twilio webhook configuration...")
-    success = await ensure_sms_webhook(twilio_config, WEBHOOK_URL)
-    if success:
-        logger.info("Twilio webhook configured successfully")
-    else:
-        logger.error("Failed to configure Twilio webhook")
+    numbers = TWILIO_PHONE_NUMBERS or [twilio_config.from_number]
+    logger.info("Checking Twilio webhook configuration for %s numbers...", len(numbers))
+    configs = [replace(twilio_config, from_number=number) for number in numbers]
+    results = await ensure_sms_webhooks(configs, WEBHOOK_URL)
+    for number, success in zip(numbers, results):
+        if success:
+            logger.info("Twilio webhook configured successfully for %s", number)
+        else:
+            logger.error("Failed to configure Twilio webhook for %s", number)
+
+
+async def on_cleanup(app: web.Application) -> None:
+    """Finish pending dispatches, then close shared connections on shutdown."""
+    await asyncio.gather(*app["bg_tasks"], return_exceptions=True)
+    if app.get("lkapi") is not None:
+        await app["lkapi"].aclose()
+    await app["context_manager"].aclose()
+    await close_http_session()
 
 
 def create_app() -> web.Application:
     """Create the aiohttp application."""
     app = web.Application()
-    app["context_manager"] = ContextManager()
+    app["context_manager"] = create_context_manager()
     app["twilio_config"] = TwilioConfig.from_env()
+    app["bg_tasks"] = set()
     
     # Routes
     app.router.add_post("/webhook/twilio/receive", handle_twilio_webhook)
     app.router.add_post("/webhook/agent/complete", handle_agent_complete)
     app.router.add_get("/health", handle_health)
     
-    # Startup hook
+    # Lifecycle hooks
     app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
     
     return app
 
@@ -262,10 +318,10 @@ def main() -> None:
     twilio_config = TwilioConfig.from_env()
 
     logger.info("SMS Dispatcher starting")
-    logger.info(f"URL: http://localhost:{PORT}")
-    logger.info(f"Webhook URL: {WEBHOOK_URL or 'Not configured'}")
-    logger.info(f"Twilio: {twilio_config.from_number or 'Not configured'}")
-    logger.info(f"Agent name: {AGENT_NAME}")
+    logger.info("URL: http://localhost:%s", PORT)
+    logger.info("Webhook URL: %s", WEBHOOK_URL or 'Not configured')
+    logger.info("Twilio: %s", twilio_config.from_number or 'Not configured')
+    logger.info("Agent name: %s", AGENT_NAME)
 
     if not WEBHOOK_URL:
         logger.warning("WEBHOOK_URL not set - workers won't be able to callback")
@@ -281,7 +337,12 @@ def main() -> None:
     if not all([livekit_url, livekit_key, livekit_secret]):
         logger.warning("Missing LIVEKIT_URL, LIVEKIT_API_KEY, or LIVEKIT_API_SECRET")
 
-    web.run_app(create_app(), port=PORT, print=None)
+    if sys.platform != "win32":
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    web.run_app(create_app(), port=PORT, print=None, access_log=None)
 
 
 if __name__ == "__main__":
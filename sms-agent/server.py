@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+import sys
 from pathlib import Path
 
 from aiohttp import web
@@ -11,7 +13,15 @@ local_env = Path(__file__).parent / ".env"
 root_env = Path(__file__).parent.parent / ".env"
 load_dotenv(local_env if local_env.exists() else root_env)
 
-from agent import ContextManager, SMSResult, process_sms, TwilioConfig
+from agent import (
+    SMSResult,
+    TwilioConfig,
+    create_context_manager,
+    empty_twiml_response,
+    process_sms,
+    read_webhook_form,
+)
+from agent.http_tools import close_http_session
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +39,7 @@ PORT = int(os.getenv("SMS_AGENT_PORT", "5000"))
 
 async def handle_twilio_webhook(request: web.Request) -> web.Response:
     try:
-        data = await request.post()
+        data = await read_webhook_form(request)
         from_number = data.get("From", "")
         to_number = data.get("To", "")
         body = data.get("Body", "")
@@ -44,14 +54,10 @@ async def handle_twilio_webhook(request: web.Request) -> web.Response:
         )
         _log_result(result)
 
-        return web.json_response({
-            "status": "success",
-            "action": result.action,
-            "message": result.message,
-            "reason": result.reason,
-        })
+        # The reply goes out through the API, so Twilio just needs an empty TwiML ack
+        return empty_twiml_response()
     except Exception as e:
-        logger.exception(f"Webhook error: {e}")
+        logger.exception("Webhook error: %s", e)
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
@@ -79,26 +85,32 @@ async def handle_test(request: web.Request) -> web.Response:
             "reason": result.reason,
         })
     except Exception as e:
-        logger.exception(f"Test error: {e}")
+        logger.exception("Test error: %s", e)
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
 
 def _log_result(result: SMSResult) -> None:
     if result.action == "sent":
-        logger.info(f"→ Sent: {result.message}")
+        logger.info("→ Sent: %s", result.message)
     elif result.action == "skipped":
-        logger.info(f"→ Skipped: {result.reason}")
+        logger.info("→ Skipped: %s", result.reason)
     else:
-        logger.error(f"→ Error: {result.reason}")
+        logger.error("→ Error: %s", result.reason)
+
+
+async def on_cleanup(app: web.Application) -> None:
+    await app["context_manager"].aclose()
+    await close_http_session()
 
 
 def create_app() -> web.Application:
     app = web.Application()
-    app["context_manager"] = ContextManager()
+    app["context_manager"] = create_context_manager()
     app["twilio_config"] = TwilioConfig.from_env()
     app.router.add_post("/webhook/twilio/receive", handle_twilio_webhook)
     app.router.add_get("/health", handle_health)
     app.router.add_post("/test", handle_test)
+    app.on_cleanup.append(on_cleanup)
     return app
 
 
@@ -106,13 +118,18 @@ def main() -> None:
     twilio_config = TwilioConfig.from_env()
 
     logger.info("SMS Agent Server starting")
-    logger.info(f"URL: http://localhost:{PORT}")
-    logger.info(f"Twilio: {twilio_config.from_number or 'Not configured'}")
+    logger.info("URL: http://localhost:%s", PORT)
+    logger.info("Twilio: %s", twilio_config.from_number or 'Not configured')
 
     if not twilio_config.is_configured():
         logger.warning("Missing TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, or TWILIO_PHONE_NUMBER")
 
-    web.run_app(create_app(), port=PORT, print=None)
+    if sys.platform != "win32":
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    web.run_app(create_app(), port=PORT, print=None, access_log=None)
 
 
 if __name__ == "__main__":
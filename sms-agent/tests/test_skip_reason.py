@@ -0,0 +1,54 @@
+import pytest
+
+from agent.sms_agent import skip_reason
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "Your verification code is 123456",
+        "Your verification code is 123456. Don't share it with anyone.",
+        "Your code is 4821",
+        "<#> Your WhatsApp code is 123-456",
+        "Your Uber code: 1234. Never share this code.",
+        "Your Amazon OTP is 443322",
+        "Verification code: 998877",
+        "OTP: 55512",
+        "123456 is your Google verification code",
+        "G-123456 is your Google verification code.",
+    ],
+)
+def test_verification_codes_are_skipped(body: str) -> None:
+    assert skip_reason(body).startswith("automated message")
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "What's the weather in zip code 94103?",
+        "Is the security deposit 1500 refundable?",
+        "Can't login since 2023, help",
+        "Your pin: 1234 doesn't work, help",
+        "your zip code is 94103 right?",
+        "Your code is 1234 doesn't work",
+        "my verification code 123456 isn't arriving",
+        "your code is broken lol",
+        "ok thanks",
+    ],
+)
+def test_real_messages_are_not_skipped(body: str) -> None:
+    assert skip_reason(body) is None
+
+
+@pytest.mark.parametrize(
+    ("body", "reason"),
+    [
+        ("", "empty message"),
+        ("   ", "empty message"),
+        ("STOP", "opt-out request"),
+        ("unsubscribe.", "opt-out request"),
+        ("HELP", "carrier keyword"),
+    ],
+)
+def test_keywords(body: str, reason: str) -> None:
+    assert skip_reason(body) == reason
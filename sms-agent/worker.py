@@ -13,11 +13,17 @@ Run with: python worker.py dev  (or use LiveKit Cloud deployment)
 
 from __future__ import annotations
 
-import json
+import asyncio
+import gzip
 import logging
+import os
+import random
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
 
+import orjson
 import aiohttp
 from dotenv import load_dotenv
 from livekit.agents import JobContext, WorkerOptions, cli
@@ -29,8 +35,8 @@ root_env = Path(__file__).parent.parent / ".env"
 load_dotenv(local_env if local_env.exists() else root_env)
 
 from agent import SMSAgent, SMSResult, TwilioConfig
-from agent.http_tools import get_weather_by_city
-from agent.twilio_utils import send_sms
+from agent.http_tools import close_http_session, get_http_session, get_weather_by_city
+from agent.twilio_utils import SendSMSResult, send_sms
 
 # Quiet noisy loggers
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -40,6 +46,37 @@ logging.getLogger("asyncio").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# Shared result for runs that produced nothing; never mutated
+_ERROR_NO_OUTPUT = SMSResult(action="error", reason="No output from agent")
+
+# Wall-clock budget for one agent run, and its tool-call limit (weather + send fits easily)
+RUN_DEADLINE_S = float(os.getenv("SMS_WORKER_DEADLINE_S", "20"))
+MAX_TOOL_STEPS = 4
+
+# Jobs one worker process runs at once. Past this it reports itself full and
+# LiveKit dispatches to another worker. (LiveKit Cloud ignores custom load
+# functions and uses its own CPU-based one.)
+MAX_CONCURRENT_JOBS = int(os.getenv("SMS_MAX_CONCURRENT_JOBS", "8"))
+
+# Callback delivery: retries on transient failures with exponential backoff + jitter.
+# A short connect timeout fails fast on an unreachable server so a retry still fits.
+_CALLBACK_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3, sock_connect=3, sock_read=10)
+CALLBACK_ATTEMPTS = 3
+CALLBACK_BACKOFF_BASE = 0.2
+# The POST finishes in the job's shutdown callback, so all attempts and waits must
+# end well inside the framework's shutdown timeout; Retry-After is capped to match
+CALLBACK_DEADLINE_S = 25.0
+CALLBACK_MAX_RETRY_AFTER = 5.0
+# Statuses where the server did not process the request, so retrying can't double-append
+_RETRY_STATUSES = (502, 503)
+
+# Histories longer than this are parsed on a worker thread; shorter ones aren't worth the hop
+THREADED_PARSE_MIN_ITEMS = 20
+
+# Callback bodies above this size are gzipped; smaller ones aren't worth it
+COMPRESS_MIN_BYTES = 1024
+
+
 
 @dataclass
 class WorkerSMSContext:
@@ -50,39 +87,77 @@ class WorkerSMSContext:
     callback_url: str
 
 
+@lru_cache(maxsize=32)
+def get_twilio_config(account_sid: str, auth_token: str, from_number: str) -> TwilioConfig:
+    """Share one TwilioConfig (and its cached BasicAuth) per credential set across jobs."""
+    return TwilioConfig(account_sid=account_sid, auth_token=auth_token, from_number=from_number)
+
+
 async def post_context_update(
     callback_url: str,
     phone_number: str,
-    chat_context: dict,
-    result: dict,
+    new_items: list[dict],
+    result: SMSResult,
 ) -> bool:
-    """POST updated context back to the webhook server."""
+    """POST this turn's history items back to the webhook server, which appends them."""
     if not callback_url:
         logger.warning("No callback URL provided, skipping context update")
         return False
     
     payload = {
         "phone_number": phone_number,
-        "chat_context": chat_context,
+        "new_items": new_items,
         "result": result,
     }
+    # orjson serializes the SMSResult dataclass natively
+    body = orjson.dumps(payload)
+    headers = {"Content-Type": "application/json"}
+    if len(body) > COMPRESS_MIN_BYTES:
+        # aiohttp servers decompress request bodies automatically
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
     
-    try:
-        async with aiohttp.ClientSession() as session:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CALLBACK_DEADLINE_S
+    for attempt in range(CALLBACK_ATTEMPTS):
+        retry_after: float | None = None
+        try:
+            # This loop's keep-alive session, closed by the job's shutdown callback
+            session = await get_http_session()
             async with session.post(
                 callback_url,
-                json=payload,
-                timeout=30,
+                data=body,
+                headers=headers,
+                timeout=_CALLBACK_TIMEOUT,
             ) as resp:
                 if resp.status in (200, 201):
-                    logger.info(f"Context update posted successfully to {callback_url}")
+                    logger.info("Context update posted successfully to %s", callback_url)
                     return True
                 error = await resp.text()
-                logger.error(f"Failed to post context update: HTTP {resp.status}: {error}")
-                return False
-    except Exception as e:
-        logger.exception(f"Error posting context update: {e}")
-        return False
+                if resp.status not in _RETRY_STATUSES:
+                    logger.error("Failed to post context update: HTTP %s: %s", resp.status, error)
+                    return False
+                logger.warning("Context update got HTTP %s (attempt %s)", resp.status, attempt + 1)
+                try:
+                    retry_after = min(float(resp.headers.get("Retry-After", "")), CALLBACK_MAX_RETRY_AFTER)
+                except ValueError:
+                    pass
+        except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+            # Never reached the server, so it's safe to send again
+            logger.warning("Could not connect for context update (attempt %s): %s", attempt + 1, e)
+        except Exception as e:
+            logger.exception("Error posting context update: %s", e)
+            return False
+        
+        if attempt + 1 < CALLBACK_ATTEMPTS:
+            delay = max(CALLBACK_BACKOFF_BASE * 2**attempt + random.random() * 0.1, retry_after or 0)
+            # Only retry if the next attempt can still time out before the deadline
+            if loop.time() + delay + _CALLBACK_TIMEOUT.total > deadline:
+                break
+            await asyncio.sleep(delay)
+    
+    logger.error("Giving up on context update after %s attempts", attempt + 1)
+    return False
 
 
 async def entrypoint(ctx: JobContext) -> None:
@@ -90,9 +165,9 @@ async def entrypoint(ctx: JobContext) -> None:
     
     # Parse metadata from dispatch request
     try:
-        metadata = json.loads(ctx.job.metadata) if ctx.job.metadata else {}
-    except json.JSONDecodeError:
-        logger.error(f"Invalid metadata JSON: {ctx.job.metadata}")
+        metadata = orjson.loads(ctx.job.metadata) if ctx.job.metadata else {}
+    except orjson.JSONDecodeError:
+        logger.error("Invalid metadata JSON: %s", ctx.job.metadata)
         return
     
     phone_number = metadata.get("phone_number", "")
@@ -105,13 +180,23 @@ async def entrypoint(ctx: JobContext) -> None:
         logger.error("Missing phone_number or incoming_message in metadata")
         return
     
-    logger.info(f"Processing SMS from {phone_number}: {incoming_message}")
+    logger.info("Processing SMS from %s: %s", phone_number, incoming_message)
+    
+    # Tool, Twilio and callback HTTP calls share this job's event-loop session; close
+    # it on shutdown, after any callback POST still in flight has finished with it
+    pending_posts: list[asyncio.Task] = []
+
+    async def on_shutdown() -> None:
+        await asyncio.gather(*pending_posts, return_exceptions=True)
+        await close_http_session()
+
+    ctx.add_shutdown_callback(on_shutdown)
     
     # Build Twilio config from metadata
-    twilio_config = TwilioConfig(
-        account_sid=twilio_config_data.get("account_sid", ""),
-        auth_token=twilio_config_data.get("auth_token", ""),
-        from_number=twilio_config_data.get("from_number", ""),
+    twilio_config = get_twilio_config(
+        twilio_config_data.get("account_sid", ""),
+        twilio_config_data.get("auth_token", ""),
+        twilio_config_data.get("from_number", ""),
     )
     
     if not twilio_config.is_configured():
@@ -122,10 +207,14 @@ async def entrypoint(ctx: JobContext) -> None:
     saved_ctx = None
     if chat_context_data:
         try:
-            saved_ctx = ChatContext.from_dict(chat_context_data)
-            logger.info(f"Restored {len(saved_ctx.items)} history items")
+            if len(chat_context_data.get("items", [])) > THREADED_PARSE_MIN_ITEMS:
+                # Validating a long history is pure CPU; keep the event loop responsive
+                saved_ctx = await asyncio.to_thread(ChatContext.from_dict, chat_context_data)
+            else:
+                saved_ctx = ChatContext.from_dict(chat_context_data)
+            logger.info("Restored %s history items", len(saved_ctx.items))
         except Exception as e:
-            logger.warning(f"Failed to restore chat context: {e}")
+            logger.warning("Failed to restore chat context: %s", e)
     
     # Create worker context (doesn't need ContextManager since we callback)
     worker_context = WorkerSMSContext(
@@ -137,75 +226,112 @@ async def entrypoint(ctx: JobContext) -> None:
     
     # Run the SMS agent
     sms_result: SMSResult | None = None
-    all_items = []
+    new_items = []
+    fallback_text: str | None = None
+    fallback_send: asyncio.Task[SendSMSResult] | None = None
     
     async with AgentSession[WorkerSMSContext](
         llm="openai/gpt-4o-mini",
         userdata=worker_context,
-        max_tool_steps=10,
+        max_tool_steps=MAX_TOOL_STEPS,
     ) as session:
         await session.start(SMSAgent(chat_ctx=saved_ctx))
         
         try:
-            result: RunResult[SMSResult] = await session.run(
-                user_input=incoming_message,
-                output_type=SMSResult,
+            result: RunResult[SMSResult] = await asyncio.wait_for(
+                session.run(user_input=incoming_message, output_type=SMSResult),
+                timeout=RUN_DEADLINE_S,
             )
             sms_result = result.final_output
+        except asyncio.TimeoutError:
+            # wait_for only stops waiting; interrupt the agent's reply and tool calls
+            # so nothing is still running when the fallback below looks at the history
+            logger.warning("Agent run exceeded %ss deadline", RUN_DEADLINE_S)
+            await session.interrupt()
         except RuntimeError as e:
-            logger.warning(f"Agent didn't call tool: {e}")
+            logger.warning("Agent didn't call tool: %s", e)
         
-        # Merge old history + new items
+        # Session history holds only this turn's items
         old_items = saved_ctx.items if saved_ctx else []
         new_items = session.history.items
-        all_items = list(old_items) + list(new_items)
         
-        # Log stats
-        user_msgs = sum(1 for i in all_items if i.type == "message" and i.role == "user")
-        tool_calls = sum(1 for i in all_items if i.type == "function_call")
-        logger.info(f"Context: {len(all_items)} items | {user_msgs} user msgs | {tool_calls} tool calls")
+        # Log stats in one pass, and only when they'll be logged
+        if logger.isEnabledFor(logging.INFO):
+            user_msgs = tool_calls = 0
+            for item in chain(old_items, new_items):
+                if item.type == "message" and item.role == "user":
+                    user_msgs += 1
+                elif item.type == "function_call":
+                    tool_calls += 1
+            logger.info(
+                "Context: %s items | %s user msgs | %s tool calls",
+                len(old_items) + len(new_items), user_msgs, tool_calls,
+            )
         
-        # Handle fallback if agent didn't call send_sms
-        if not sms_result:
-            for item in reversed(session.history.items):
-                if item.type == "message" and item.role == "assistant":
-                    text = item.content[0] if item.content else None
-                    if text and isinstance(text, str):
-                        logger.info(f"Fallback: sending assistant message as SMS: {text}")
-                        send_result = await send_sms(twilio_config, phone_number, text)
-                        if send_result.success:
-                            sms_result = SMSResult(action="sent", message=text)
-                        else:
-                            logger.error(f"Fallback failed: {send_result.error}")
-                            sms_result = SMSResult(action="error", reason=send_result.error)
-                        break
+        # Handle fallback if agent didn't call send_sms. Only this turn's items can
+        # hold the assistant message, and the latest one is near the end.
+        # A send_sms call cut off by the deadline may still have delivered, so
+        # never send a second message after one.
+        if not sms_result and any(
+            item.type == "function_call" and item.name == "send_sms" for item in new_items
+        ):
+            logger.warning("Agent called send_sms without finishing; skipping fallback")
+        elif not sms_result:
+            last_assistant_msg = next(
+                (item for item in reversed(new_items) if item.type == "message" and item.role == "assistant"),
+                None,
+            )
+            text = last_assistant_msg.content[0] if last_assistant_msg and last_assistant_msg.content else None
+            if text and isinstance(text, str):
+                logger.info("Fallback: sending assistant message as SMS: %s", text)
+                # Runs while the session closes and the context is serialized below
+                fallback_text = text
+                fallback_send = asyncio.create_task(send_sms(twilio_config, phone_number, text))
+    
+    # POST updated context back to webhook server
+    # The server already has the earlier history; send only this turn's items
+    new_history = ChatContext(list(new_items)).to_dict(exclude_function_call=False)["items"]
+    
+    if fallback_send is not None:
+        send_result = await fallback_send
+        if send_result.success:
+            sms_result = SMSResult(action="sent", message=fallback_text)
+        else:
+            logger.error("Fallback failed: %s", send_result.error)
+            sms_result = SMSResult(action="error", reason=send_result.error)
     
     # Log result
     if sms_result:
         if sms_result.action == "sent":
-            logger.info(f"→ Sent: {sms_result.message}")
+            logger.info("→ Sent: %s", sms_result.message)
         elif sms_result.action == "skipped":
-            logger.info(f"→ Skipped: {sms_result.reason}")
+            logger.info("→ Skipped: %s", sms_result.reason)
         else:
-            logger.error(f"→ Error: {sms_result.reason}")
+            logger.error("→ Error: %s", sms_result.reason)
     else:
         logger.error("→ No output from agent")
-        sms_result = SMSResult(action="error", reason="No output from agent")
-    
-    # POST updated context back to webhook server
-    updated_context = ChatContext(all_items).to_dict(exclude_function_call=False)
-    result_dict = {
-        "action": sms_result.action,
-        "message": sms_result.message,
-        "reason": sms_result.reason,
-    }
+        sms_result = _ERROR_NO_OUTPUT
     
-    await post_context_update(callback_url, phone_number, updated_context, result_dict)
+    # The POST finishes during shutdown instead of holding up the job
+    pending_posts.append(
+        asyncio.create_task(post_context_update(callback_url, phone_number, new_history, sms_result))
+    )
     
     # Shutdown - we're done processing
-    logger.info(f"SMS processing complete for {phone_number}")
+    logger.info("SMS processing complete for %s", phone_number)
+
+
+def compute_load(worker) -> float:
+    """Worker load as the share of job slots in use."""
+    return min(len(worker.active_jobs) / MAX_CONCURRENT_JOBS, 1.0)
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, agent_name="sms-agent"))
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        agent_name="sms-agent",
+        load_fnc=compute_load,
+        # Full once every slot is taken; production requires a threshold below 1
+        load_threshold=1 - 0.5 / MAX_CONCURRENT_JOBS,
+    ))
 